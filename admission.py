@@ -0,0 +1,78 @@
+import time
+from collections import OrderedDict
+
+from astrbot.api import logger
+
+
+class TokenBucket:
+    """令牌桶：按 rate（个/秒）持续补充令牌，最多积攒 burst 个"""
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def available(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def take(self, count: float = 1):
+        self.tokens -= count
+
+
+class AdmissionController:
+    """
+    准入控制：在 LLM 识别与接口请求之前按令牌桶限流
+    - 规则 global（全局）/ group（每个群）/ user（每个用户），各自配置每分钟条数与突发容量
+    - 每分钟条数 <=0 的规则不限流
+    - 只有所有规则都有余量时才放行并同时扣除令牌，被拒绝的消息不消耗任何令牌
+    - 群与用户的令牌桶按最近使用保留 max_keys 个
+    - rejected 记录每条规则拒绝的消息数
+    """
+    RULES = ("user", "group", "global")
+
+    def __init__(self, limits: dict[str, tuple[float, float]], max_keys: int = 4096):
+        # limits: 规则名 -> (每分钟条数, 突发容量)
+        self.limits = {
+            rule: (per_minute / 60, burst)
+            for rule, (per_minute, burst) in limits.items()
+            if rule in self.RULES and per_minute > 0
+        }
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[tuple[str, str], TokenBucket] = OrderedDict()
+        self.admitted = 0
+        self.rejected = {rule: 0 for rule in self.RULES}
+
+    def _bucket(self, rule: str, key: str) -> TokenBucket:
+        bucket_key = (rule, key)
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self._buckets[bucket_key] = TokenBucket(*self.limits[rule])
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(bucket_key)
+        return bucket
+
+    def admit(self, group_id: str = "", user_id: str = "") -> str | None:
+        """尝试放行一条消息：放行返回 None，拒绝返回拒绝它的规则名"""
+        keys = {"user": user_id, "group": group_id, "global": "*"}
+        buckets = []
+        for rule in self.RULES:
+            if rule not in self.limits or not keys[rule]:
+                continue  # 未启用的规则、私聊没有群号等情况跳过
+            bucket = self._bucket(rule, str(keys[rule]))
+            if bucket.available() < 1:
+                self.rejected[rule] += 1
+                logger.debug(f"准入控制拒绝 | 规则: {rule} | 群: {group_id or '-'} | 用户: {user_id or '-'}")
+                return rule
+            buckets.append(bucket)
+        for bucket in buckets:
+            bucket.take()
+        self.admitted += 1
+        return None
+
+    def stats(self) -> dict:
+        return {"admitted": self.admitted, "rejected": dict(self.rejected), "tracked_keys": len(self._buckets)}
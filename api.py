@@ -1,53 +1,162 @@
+import asyncio
 import json
+import time
+from collections import deque
+
 import aiohttp
 from astrbot.api import logger
 
+from .cache import TTLCache, normalize_key
+from .net import CircuitOpenError, HttpClient
+from .tracing import span
+
 # 网易云音乐加密参数（仅 NetEaseMusicAPI 类使用，NodeJS 版本无需依赖）
 PARAMS = "D33zyir4L/58v1qGPcIPjSee79KCzxBIBy507IYDB8EL7jEnp41aDIqpHBhowfQ6iT1Xoka8jD+0p44nRKNKUA0dv+n5RWPOO57dZLVrd+T1J/sNrTdzUhdHhoKRIgegVcXYjYu+CshdtCBe6WEJozBRlaHyLeJtGrABfMOEb4PqgI3h/uELC82S05NtewlbLZ3TOR/TIIhNV6hVTtqHDVHjkekrvEmJzT5pk1UY6r0="
 ENC_SEC_KEY = "45c8bcb07e69c6b545d3045559bd300db897509b8720ee2b45a72bf2d3b216ddc77fb10daec4ca54b466f2da1ffac1e67e245fea9d842589dc402b92b262d3495b12165a721aed880bf09a0a99ff94c959d04e49085dc21c78bbbe8e3331827c0ef0035519e89f097511065643120cbc478f9c0af96400ba4649265781fc9079"
 
 
-class NetEaseMusicAPI:
+class SingleFlight:
     """
-    网易云音乐公开API版本（兼容原有逻辑，按需使用）
+    进行中请求去重：相同 key 的并发调用共享同一个底层请求（同一个 Task）。
+    - 底层请求的结果或异常会传递给所有等待方
+    - 单个等待方被取消不影响其他等待方；所有等待方都取消时才取消底层请求
     """
     def __init__(self):
+        self._calls: dict = {}  # key -> [task, 等待方数量]
+        self.shared = 0  # 复用进行中请求的次数
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+
+    async def do(self, key, factory):
+        """factory: 无参协程函数，仅在没有相同 key 的进行中请求时调用"""
+        entry = self._calls.get(key)
+        if entry is None:
+            entry = [asyncio.ensure_future(factory()), 0]
+            self._calls[key] = entry
+
+            def _forget(_task, key=key, entry=entry):
+                if self._calls.get(key) is entry:
+                    del self._calls[key]
+
+            entry[0].add_done_callback(_forget)
+        else:
+            self.shared += 1
+
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                # 先移除 key 再取消，之后到达的调用方会发起新请求，而不是加入已取消的任务
+                if self._calls.get(key) is entry:
+                    del self._calls[key]
+                entry[0].cancel()
+
+
+# 各查询方法的有效结果判定与失败时的兜底返回值（组合后端与批量接口共用）
+RESULT_CHECKS = {
+    "fetch_data": (bool, []),
+    "fetch_comments": (bool, []),
+    "fetch_lyrics": (lambda r: bool(r) and r not in ("歌词未找到", "歌词获取失败"), "歌词获取失败"),
+    "fetch_extra": (lambda r: bool(r.get("audio_url")), {"audio_url": ""}),
+}
+
+class BatchFetchMixin:
+    """
+    批量查询接口：按歌曲 ID 批量获取音频链接、歌词、热评
+    返回 (按 ID 索引的结果, 失败的 ID 列表)；默认实现为有限并发地逐个调用单曲方法，
+    后端有原生批量接口时可覆盖对应方法（如 NodeJS 的 /song/url 支持逗号分隔的多个 ID）
+    """
+    batch_concurrency = 4
+
+    async def _fetch_many(self, method: str, ids, concurrency: int | None = None) -> tuple[dict, list]:
+        is_valid = RESULT_CHECKS[method][0]
+        semaphore = asyncio.Semaphore(concurrency or self.batch_concurrency)
+        ids = list(dict.fromkeys(ids))
+
+        async def fetch_one(song_id):
+            async with semaphore:
+                return await getattr(self, method)(song_id=song_id)
+
+        results = await asyncio.gather(*(fetch_one(song_id) for song_id in ids), return_exceptions=True)
+        found, failed = {}, []
+        for song_id, result in zip(ids, results):
+            if isinstance(result, BaseException) or not is_valid(result):
+                failed.append(song_id)
+            else:
+                found[song_id] = result
+        if failed:
+            logger.warning(f"批量查询部分失败 | 方法: {method} | 成功: {len(found)} | 失败ID: {failed}")
+        return found, failed
+
+    async def fetch_extra_many(self, ids, concurrency: int | None = None) -> tuple[dict, list]:
+        return await self._fetch_many("fetch_extra", ids, concurrency)
+
+    async def fetch_lyrics_many(self, ids, concurrency: int | None = None) -> tuple[dict, list]:
+        return await self._fetch_many("fetch_lyrics", ids, concurrency)
+
+    async def fetch_comments_many(self, ids, concurrency: int | None = None) -> tuple[dict, list]:
+        return await self._fetch_many("fetch_comments", ids, concurrency)
+
+
+class NetEaseMusicAPI(BatchFetchMixin):
+    """
+    网易云音乐公开API版本（兼容原有逻辑，按需使用）
+    """
+    def __init__(self, http: HttpClient | None = None):
         self.header = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) "
             "Chrome/55.0.2883.87 UBrowser/6.2.4098.3 Safari/537.36"
         }
         self.headers = {"referer": "http://music.163.com"}
         self.cookies = {"appver": "2.0.2"}
-        self.session = aiohttp.ClientSession()
+        # 共享 HTTP 客户端（未传入时自建并在 close 时关闭）
+        self.http = http or HttpClient()
+        self._owns_http = http is None
+        self._inflight = SingleFlight()
+        # 供网络健康监测使用的接口地址
+        self.health_urls = [
+            "http://music.163.com",
+            "https://netease-music.api.harisfox.com",
+            "https://www.hhlqilongzhu.cn",
+        ]
+
+    async def _request(self, url: str, data: dict = {}, method: str = "GET", op: str = "search"):
+        """统一请求接口（相同的并发请求共享一次 HTTP 调用；op 决定超时设置）"""
+        key = SingleFlight.make_key(method.upper(), url, data)
+        return await self._inflight.do(key, lambda: self._do_request(url, data, method, op))
 
-    async def _request(self, url: str, data: dict = {}, method: str = "GET"):
-        """统一请求接口（含错误捕获与日志）"""
+    async def _do_request(self, url: str, data: dict = {}, method: str = "GET", op: str = "search"):
+        """实际请求（含错误捕获与日志）"""
         try:
             # 关键修复：补充 full_url 定义（拼接完整URL，用于日志打印）
             full_url = url  # NetEaseMusicAPI 直接使用传入的完整URL，无需额外拼接
+            # 后端接口均为只读查询，可安全重试（熔断与重试由共享客户端处理）
+            raw_response = ""
             if method.upper() == "POST":
-                async with self.session.post(
-                    url, headers=self.header, cookies=self.cookies, data=data
-                ) as response:
-                    raw_response = await response.text()
-                    logger.debug(f"NetEase API POST 请求: {full_url} | 状态: {response.status}")
-                    if response.headers.get("Content-Type") == "application/json":
-                        return await response.json()
-                    else:
-                        return json.loads(raw_response) if raw_response else {}
+                status, raw_response, content_type = await self.http.request_text(
+                    "POST", url, op=op, headers=self.header, cookies=self.cookies, data=data
+                )
+                logger.debug(f"NetEase API POST 请求: {full_url} | 状态: {status}")
+                return json.loads(raw_response) if raw_response else {}
             elif method.upper() == "GET":
-                async with self.session.get(
-                    url, headers=self.headers, cookies=self.cookies
-                ) as response:
-                    raw_response = await response.text()
-                    logger.debug(f"NetEase API GET 请求: {full_url} | 状态: {response.status}")
-                    return await response.json() if response.headers.get("Content-Type") == "application/json" else {}
+                status, raw_response, content_type = await self.http.request_text(
+                    "GET", url, op=op, headers=self.headers, cookies=self.cookies
+                )
+                logger.debug(f"NetEase API GET 请求: {full_url} | 状态: {status}")
+                return json.loads(raw_response) if content_type == "application/json" else {}
             else:
                 raise ValueError("不支持的请求方式")
         except json.JSONDecodeError as e:
             # 修复：使用已定义的 full_url 打印日志
             logger.error(f"NetEase API JSON 解析失败: {e} | 响应内容: {raw_response[:200]} | URL: {full_url}")
             return {}
+        except CircuitOpenError as e:
+            logger.warning(f"NetEase API 请求跳过: {str(e)} | URL: {full_url}")
+            return {}
         except Exception as e:
             # 修复：使用已定义的 full_url 打印日志
             logger.error(f"NetEase API 请求失败: {str(e)} | URL: {full_url}")
@@ -83,7 +192,7 @@ class NetEaseMusicAPI:
         try:
             url = f"https://music.163.com/weapi/v1/resource/hotcomments/R_SO_4_{song_id}?csrf_token="
             data = {"params": PARAMS, "encSecKey": ENC_SEC_KEY}
-            result = await self._request(url, data=data, method="POST")
+            result = await self._request(url, data=data, method="POST", op="comments")
             return result.get("hotComments", [])
         except Exception as e:
             logger.error(f"NetEase API 获取热评失败: {str(e)} | 歌曲ID: {song_id}")
@@ -93,7 +202,7 @@ class NetEaseMusicAPI:
         """获取歌曲歌词"""
         try:
             url = f"https://netease-music.api.harisfox.com/lyric?id={song_id}"
-            result = await self._request(url, method="GET")
+            result = await self._request(url, method="GET", op="lyrics")
             return result.get("lrc", {}).get("lyric", "歌词未找到")
         except Exception as e:
             logger.error(f"NetEase API 获取歌词失败: {str(e)} | 歌曲ID: {song_id}")
@@ -103,88 +212,92 @@ class NetEaseMusicAPI:
         """获取歌曲额外信息（音频链接、封面等）"""
         try:
             url = f"https://www.hhlqilongzhu.cn/api/dg_wyymusic.php?id={song_id}&br=7&type=json"
-            result = await self._request(url, method="GET")
+            result = await self._request(url, method="GET", op="audio_url")
             return {
                 "title": result.get("title", "未知歌曲"),
                 "author": result.get("singer", "未知歌手"),
                 "cover_url": result.get("cover", ""),
                 "audio_url": result.get("music_url", ""),
+                "bitrate": "br7",  # 与请求参数 br=7 对应
             }
         except Exception as e:
             logger.error(f"NetEase API 获取额外信息失败: {str(e)} | 歌曲ID: {song_id}")
             return {"title": "未知歌曲", "author": "未知歌手", "cover_url": "", "audio_url": ""}
 
     async def close(self):
-        """关闭会话（释放资源）"""
-        await self.session.close()
+        """关闭会话（释放资源，共享客户端由插件统一关闭）"""
+        if self._owns_http:
+            await self.http.close()
 
 
-class NetEaseMusicAPINodeJs:
+class NetEaseMusicAPINodeJs(BatchFetchMixin):
     """
     网易云音乐 NodeJS API 版本（适配 https://163api.qijieya.cn）
     优化：支持 HTTPS、JSON 格式请求、浏览器头信息
     """
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, http: HttpClient | None = None):
         # 处理 BaseURL 格式（确保结尾带 "/"，避免拼接错误）
         self.base_url = base_url.rstrip("/") + "/"
-        # 初始化会话（添加浏览器头，避免 API 拦截）
-        self.session = aiohttp.ClientSession(
-            base_url=self.base_url,
-            headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36 Edg/132.0.0.0",
-                "Referer": self.base_url,
-                "Content-Type": "application/json",
-                "Accept": "application/json, text/plain, */*"
-            },
-            connector=aiohttp.TCPConnector()  # 避免 SSL 证书验证问题（可选，视 API 情况调整）
-        )
+        # 请求头（添加浏览器头，避免 API 拦截）
+        self.headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36 Edg/132.0.0.0",
+            "Referer": self.base_url,
+            "Content-Type": "application/json",
+            "Accept": "application/json, text/plain, */*"
+        }
+        # 共享 HTTP 客户端（未传入时自建并在 close 时关闭）
+        self.http = http or HttpClient()
+        self._owns_http = http is None
+        self._inflight = SingleFlight()
+        self.health_urls = [self.base_url]  # 供网络健康监测使用的接口地址
         logger.debug(f"NodeJS API 初始化完成 | BaseURL: {self.base_url}")
 
     # 新增：实现 close 方法，关闭 aiohttp 会话
     async def close(self):
-        """关闭 aiohttp 会话，释放网络资源"""
-        if hasattr(self, 'session') and not self.session.closed:
-            await self.session.close()
+        """关闭 aiohttp 会话，释放网络资源（共享客户端由插件统一关闭）"""
+        if self._owns_http:
+            await self.http.close()
             logger.info("NetEaseMusicAPINodeJs 会话已关闭")
 
-    async def _request(self, url: str, data: dict = {}, method: str = "GET"):
-        """统一请求接口（适配 NodeJS API 格式）"""
+    async def _request(self, url: str, data: dict = {}, method: str = "GET", op: str = "search"):
+        """统一请求接口（相同的并发请求共享一次 HTTP 调用；op 决定超时设置）"""
+        key = SingleFlight.make_key(method.upper(), url, data)
+        return await self._inflight.do(key, lambda: self._do_request(url, data, method, op))
+
+    async def _do_request(self, url: str, data: dict = {}, method: str = "GET", op: str = "search"):
+        """实际请求（适配 NodeJS API 格式）"""
         try:
             full_url = self.base_url + url.lstrip("/")  # 拼接完整 URL
             if method.upper() == "POST":
                 # NodeJS API 优先使用 JSON 格式传参
-                async with self.session.post(url, json=data) as response:
-                    raw_response = await response.text()
-                    logger.debug(f"NodeJS API POST 请求: {full_url} | 状态: {response.status}")
-                    logger.debug(f"NodeJS API 响应内容: {raw_response[:300]}")  # 打印前300字符（避免过长）
-                    
-                    if response.status == 200:
-                        try:
-                            return json.loads(raw_response)
-                        except json.JSONDecodeError:
-                            logger.error(f"NodeJS API JSON 解析失败 | 响应: {raw_response[:200]}")
-                            return {}
-                    else:
-                        logger.error(f"NodeJS API POST 失败 | 状态: {response.status} | 响应: {raw_response[:200]}")
-                        return {}
+                status, raw_response, _ = await self.http.request_text(
+                    "POST", full_url, op=op, json=data, headers=self.headers
+                )
+                logger.debug(f"NodeJS API POST 请求: {full_url} | 状态: {status}")
+                logger.debug(f"NodeJS API 响应内容: {raw_response[:300]}")  # 打印前300字符（避免过长）
             elif method.upper() == "GET":
-                async with self.session.get(url, params=data) as response:
-                    raw_response = await response.text()
-                    logger.debug(f"NodeJS API GET 请求: {full_url} | 状态: {response.status}")
-                    if response.status == 200:
-                        try:
-                            return json.loads(raw_response)
-                        except json.JSONDecodeError:
-                            logger.error(f"NodeJS API GET JSON 解析失败 | 响应: {raw_response[:200]}")
-                            return {}
-                    else:
-                        logger.error(f"NodeJS API GET 失败 | 状态: {response.status} | 响应: {raw_response[:200]}")
-                        return {}
+                status, raw_response, _ = await self.http.request_text(
+                    "GET", full_url, op=op, params=data, headers=self.headers
+                )
+                logger.debug(f"NodeJS API GET 请求: {full_url} | 状态: {status}")
             else:
                 raise ValueError(f"不支持的请求方式: {method}")
+
+            if status == 200:
+                try:
+                    return json.loads(raw_response)
+                except json.JSONDecodeError:
+                    logger.error(f"NodeJS API {method.upper()} JSON 解析失败 | 响应: {raw_response[:200]}")
+                    return {}
+            else:
+                logger.error(f"NodeJS API {method.upper()} 失败 | 状态: {status} | 响应: {raw_response[:200]}")
+                return {}
         except aiohttp.ClientSSLError:
             logger.error(f"NodeJS API SSL 证书验证失败 | 建议检查 API 地址或关闭 SSL 验证")
             return {}
+        except CircuitOpenError as e:
+            logger.warning(f"NodeJS API 请求跳过: {str(e)} | URL: {full_url}")
+            return {}
         except Exception as e:
             logger.error(f"NodeJS API 请求异常 | URL: {full_url} | 错误: {str(e)}")
             return {}
@@ -220,7 +333,7 @@ class NetEaseMusicAPINodeJs:
         try:
             url = "/comment/hot"  # NodeJS 热评接口路径
             data = {"id": song_id, "type": 0, "limit": 10}  # type=0 表示歌曲
-            result = await self._request(url, data=data, method="POST")
+            result = await self._request(url, data=data, method="POST", op="comments")
             return result.get("hotComments", [])
         except Exception as e:
             logger.error(f"NodeJS API 获取热评失败 | 歌曲ID: {song_id} | 错误: {str(e)}")
@@ -231,7 +344,7 @@ class NetEaseMusicAPINodeJs:
         try:
             url = "/lyric"  # NodeJS 歌词接口路径
             data = {"id": song_id, "os": "pc"}  # 增加 os 参数适配部分 NodeJS 服务
-            result = await self._request(url, data=data, method="GET")
+            result = await self._request(url, data=data, method="GET", op="lyrics")
             return result.get("lrc", {}).get("lyric", "歌词未找到")
         except Exception as e:
             logger.error(f"NodeJS API 获取歌词失败 | 歌曲ID: {song_id} | 错误: {str(e)}")
@@ -250,7 +363,7 @@ class NetEaseMusicAPINodeJs:
                 "br": 320000  # 320k 高质量音频
             }
             logger.debug(f"NodeJS API 请求音频链接 | song_id: {song_id_str} | 参数: {data}")
-            result = await self._request(url, data=data, method="POST")
+            result = await self._request(url, data=data, method="POST", op="audio_url")
             
             # 关键修复3：增强响应解析容错（打印完整响应，便于定位格式问题）
             logger.debug(f"NodeJS API 音频响应: {json.dumps(result, ensure_ascii=False)[:500]}")
@@ -265,10 +378,10 @@ class NetEaseMusicAPINodeJs:
                 if not audio_url:
                     logger.error(f"NodeJS API 音频链接为空 | song_id: {song_id_str} | 响应: {result}")
                     return {"audio_url": ""}
-                return {"audio_url": audio_url}
+                return {"audio_url": audio_url, "bitrate": str(result["data"][0].get("br") or data["br"])}
             # 情况2：响应是 {"url": "..."}（部分 API 简化格式）
             elif "url" in result and result["url"]:
-                return {"audio_url": result["url"]}
+                return {"audio_url": result["url"], "bitrate": str(data["br"])}
             # 情况3：响应格式不匹配
             else:
                 logger.error(f"NodeJS API 音频响应格式错误 | song_id: {song_id_str} | 响应: {result}")
@@ -277,12 +390,45 @@ class NetEaseMusicAPINodeJs:
             logger.error(f"NodeJS API 获取音频链接失败 | song_id: {song_id} | 错误: {str(e)} | 堆栈: {traceback.format_exc()}")
             return {"audio_url": ""}
 
+    async def fetch_extra_many(self, ids, concurrency: int | None = None, chunk_size: int = 50) -> tuple[dict, list]:
+        """
+        批量获取音频链接：/song/url 支持逗号分隔的多个 ID，每 chunk_size 个 ID 一次请求，
+        同时进行的请求数不超过 concurrency（默认 batch_concurrency）；请求失败的分块计入失败 ID
+        """
+        by_str = {str(song_id): song_id for song_id in ids}
+        keys = list(by_str)
+        chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+        semaphore = asyncio.Semaphore(concurrency or self.batch_concurrency)
+
+        async def fetch_chunk(chunk):
+            async with semaphore:
+                return await self._request(
+                    "/song/url",
+                    data={"id": ",".join(chunk), "ids": ",".join(chunk), "br": 320000},
+                    method="POST",
+                    op="audio_url",
+                )
+
+        replies = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks), return_exceptions=True)
+        found = {}
+        for reply in replies:
+            if isinstance(reply, BaseException) or not isinstance(reply, dict):
+                continue
+            for item in reply.get("data") or []:
+                key = str(item.get("id", ""))
+                if key in by_str and item.get("url"):
+                    found[by_str[key]] = {"audio_url": item["url"], "bitrate": str(item.get("br") or 320000)}
+        failed = [song_id for key, song_id in by_str.items() if song_id not in found]
+        if failed:
+            logger.warning(f"NodeJS API 批量获取音频链接部分失败 | 成功: {len(found)} | 失败ID: {failed}")
+        return found, failed
+
 
 class MusicSearcher:
     """
     多平台音乐搜索工具类（保留原有功能，支持 QQ/网易云/酷狗等平台）
     """
-    def __init__(self):
+    def __init__(self, http: HttpClient | None = None):
         self.base_url = "https://music.txqq.pro/"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36 Edg/132.0.0.0",
@@ -290,10 +436,21 @@ class MusicSearcher:
             "X-Requested-With": "XMLHttpRequest",
             "Referer": "https://music.txqq.pro/"
         }
-        self.session = aiohttp.ClientSession()
+        # 共享 HTTP 客户端（未传入时自建并在 close 时关闭）
+        self.http = http or HttpClient()
+        self._owns_http = http is None
+        self._inflight = SingleFlight()
+        self.health_urls = [self.base_url]  # 供网络健康监测使用的接口地址
 
-    async def fetch_data(self, song_name: str, platform_type: str, limit: int = 5):
-        """多平台搜索歌曲（platform_type 支持 qq/netease/kugou 等）"""
+    async def fetch_data(self, song_name: str, platform_type: str = "netease", limit: int = 5):
+        """多平台搜索歌曲（platform_type 支持 qq/netease/kugou 等，相同的并发搜索共享一次请求）"""
+        key = SingleFlight.make_key("search", song_name, platform_type, limit)
+        return await self._inflight.do(
+            key, lambda: self._fetch_data(song_name, platform_type, limit)
+        )
+
+    async def _fetch_data(self, song_name: str, platform_type: str, limit: int = 5):
+        """实际搜索请求"""
         try:
             data = {
                 "input": song_name,
@@ -301,34 +458,195 @@ class MusicSearcher:
                 "type": platform_type,
                 "page": 1,
             }
-            async with self.session.post(
-                self.base_url, data=data, headers=self.headers
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    if "songs" not in result or not isinstance(result["songs"], list):
-                        logger.error(f"MusicSearcher 响应格式错误 | 平台: {platform_type} | 响应: {result}")
-                        return []
-                    # 结构化返回结果（完整闭合所有花括号和括号）
-                    return [
-                        {
-                            "id": song["songid"],
-                            "name": song.get("title", "未知歌曲"),
-                            "artists": song.get("author", "未知歌手"),
-                            "url": song.get("url", "无"),
-                            "link": song.get("link", "无"),
-                            "lyrics": song.get("lrc", "无"),
-                            "cover_url": song.get("pic", "无")
-                        }
-                        for song in result["songs"][:limit]
-                    ]
-                else:
-                    logger.error(f"MusicSearcher 请求失败 | 平台: {platform_type} | 状态码: {response.status}")
+            status, raw_response, _ = await self.http.request_text(
+                "POST", self.base_url, op="search", data=data, headers=self.headers
+            )
+            if status == 200:
+                result = json.loads(raw_response)
+                if "songs" not in result or not isinstance(result["songs"], list):
+                    logger.error(f"MusicSearcher 响应格式错误 | 平台: {platform_type} | 响应: {result}")
                     return []
+                # 结构化返回结果（完整闭合所有花括号和括号）
+                return [
+                    {
+                        "id": song["songid"],
+                        "name": song.get("title", "未知歌曲"),
+                        "artists": song.get("author", "未知歌手"),
+                        "url": song.get("url", "无"),
+                        "link": song.get("link", "无"),
+                        "lyrics": song.get("lrc", "无"),
+                        "cover_url": song.get("pic", "无")
+                    }
+                    for song in result["songs"][:limit]
+                ]
+            else:
+                logger.error(f"MusicSearcher 请求失败 | 平台: {platform_type} | 状态码: {status}")
+                return []
+        except CircuitOpenError as e:
+            logger.warning(f"MusicSearcher 请求跳过: {str(e)} | 关键词: {song_name}")
+            return []
         except Exception as e:
             logger.error(f"MusicSearcher 搜索异常 | 关键词: {song_name} | 错误: {str(e)}")
             return []
 
     async def close(self):
-        """关闭会话释放资源"""
-        await self.session.close()
\ No newline at end of file
+        """关闭会话释放资源（共享客户端由插件统一关闭）"""
+        if self._owns_http:
+            await self.http.close()
+
+
+class FailoverMusicAPI(BatchFetchMixin):
+    """
+    组合后端：按优先级顺序使用多个音乐后端
+    - 对冲请求：当前后端在其历史 p90 延迟内未返回时，向下一个后端发起相同请求，
+      取最先返回的有效结果，其余请求取消
+    - 故障转移：某个后端返回空结果或失败时立即改用下一个后端
+    - 只有实现了对应方法的后端参与（MusicSearcher 仅参与搜索）；
+      NetEase 各后端共用网易云歌曲 ID，搜索与后续请求可由不同后端完成
+    - 延迟样本不足 min_samples 时使用 default_hedge_delay 作为对冲等待时间
+    """
+    def __init__(
+        self,
+        backends: dict,
+        hedge_quantile: float = 0.9,
+        default_hedge_delay: float = 1.0,
+        min_samples: int = 10,
+        window: int = 100,
+    ):
+        self.backends = dict(backends)  # 名称 -> 后端实例（按优先级排列）
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.latencies = {name: deque(maxlen=window) for name in self.backends}
+        self.counters = {name: {"calls": 0, "wins": 0, "misses": 0} for name in self.backends}
+        self.hedged = 0
+        self.failovers = 0
+        self.health_urls = [
+            url for backend in self.backends.values() for url in getattr(backend, "health_urls", [])
+        ]
+
+    def hedge_delay(self, name: str) -> float:
+        """后端的对冲等待时间（历史成功延迟的 p90）"""
+        samples = self.latencies[name]
+        if len(samples) < self.min_samples:
+            return self.default_hedge_delay
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_quantile))]
+
+    async def _call(self, name: str, method: str, args: tuple, kwargs: dict):
+        self.counters[name]["calls"] += 1
+        start = time.perf_counter()
+        with span("backend", backend=name, method=method) as trace_attrs:
+            result = await getattr(self.backends[name], method)(*args, **kwargs)
+            valid = RESULT_CHECKS[method][0](result)
+            if trace_attrs is not None:
+                trace_attrs["valid"] = valid
+        if valid:
+            self.latencies[name].append(time.perf_counter() - start)
+        return result
+
+    async def _race(self, method: str, *args, **kwargs):
+        is_valid, fallback = RESULT_CHECKS[method]
+        candidates = [name for name, backend in self.backends.items() if hasattr(backend, method)]
+        pending: dict[asyncio.Task, str] = {}
+        launched = 0
+        result = fallback
+
+        def launch():
+            nonlocal launched
+            name = candidates[launched]
+            launched += 1
+            pending[asyncio.create_task(self._call(name, method, args, kwargs))] = name
+
+        if candidates:
+            launch()
+        try:
+            while pending:
+                timeout = self.hedge_delay(candidates[launched - 1]) if launched < len(candidates) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedged += 1
+                    logger.debug(f"对冲请求 | 方法: {method} | 等待 {timeout:.2f}秒未返回，追加后端: {candidates[launched]}")
+                    launch()
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    error = task.exception()
+                    if error is None and is_valid(task.result()):
+                        self.counters[name]["wins"] += 1
+                        return task.result()
+                    self.counters[name]["misses"] += 1
+                    if error is None:
+                        result = task.result()
+                    else:
+                        logger.error(f"组合后端调用异常 | 后端: {name} | 方法: {method} | 错误: {str(error)}")
+                    if launched < len(candidates):
+                        self.failovers += 1
+                        logger.debug(f"故障转移 | 方法: {method} | 后端 {name} 无有效结果，改用: {candidates[launched]}")
+                        launch()
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def fetch_data(self, keyword: str, limit=5) -> list[dict]:
+        return await self._race("fetch_data", keyword, limit=limit)
+
+    async def fetch_comments(self, song_id: int):
+        return await self._race("fetch_comments", song_id=song_id)
+
+    async def fetch_lyrics(self, song_id):
+        return await self._race("fetch_lyrics", song_id=song_id)
+
+    async def fetch_extra(self, song_id: str | int) -> dict[str, str]:
+        return await self._race("fetch_extra", song_id=song_id)
+
+    def stats(self) -> dict:
+        return {
+            "hedged": self.hedged,
+            "failovers": self.failovers,
+            "backends": {
+                name: {**counters, "hedge_delay": round(self.hedge_delay(name), 3)}
+                for name, counters in self.counters.items()
+            },
+        }
+
+    async def close(self):
+        for backend in self.backends.values():
+            await backend.close()
+
+
+class CachedSearchAPI:
+    """
+    搜索结果缓存层：包装任意音乐后端，缓存 fetch_data 的结果，其余方法原样透传。
+    缓存键 = 后端类型 + 归一化关键词 + 其余搜索参数（limit、平台等）；
+    空结果（含请求失败）按较短的 negative_ttl 缓存，避免对无结果关键词反复请求。
+    """
+    def __init__(self, backend, maxsize: int = 256, ttl: float = 3600, negative_ttl: float = 60):
+        self.backend = backend
+        self.backend_name = type(backend).__name__
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.negative_ttl = negative_ttl
+        self.negative_hits = 0
+
+    def __getattr__(self, name):
+        # 未覆盖的方法（fetch_extra / fetch_lyrics / close 等）直接交给被包装的后端
+        return getattr(self.backend, name)
+
+    async def fetch_data(self, keyword: str, *args, **kwargs) -> list[dict]:
+        key = (self.backend_name, normalize_key(keyword), args, tuple(sorted(kwargs.items())))
+        cached = self.cache.get(key)
+        if cached is not None:
+            if not cached:
+                self.negative_hits += 1
+            logger.debug(f"搜索缓存命中 | 后端: {self.backend_name} | 关键词: {keyword}")
+            with span("search_cache_hit", backend=self.backend_name):
+                return list(cached)
+
+        with span("search_cache_miss", backend=self.backend_name):
+            result = await self.backend.fetch_data(keyword, *args, **kwargs)
+        self.cache.set(key, list(result), ttl=None if result else self.negative_ttl)
+        return result
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "negative_hits": self.negative_hits}
@@ -0,0 +1 @@
+"""离线基准测试：本地 aiohttp 桩服务 + api.py 各后端的吞吐量/延迟测量（不访问外网）"""
@@ -0,0 +1,201 @@
+"""
+api.py 各后端的离线基准测试：启动本地桩服务，在逐级增加的并发下测量 fetch_data / fetch_extra /
+fetch_lyrics / fetch_comments 的吞吐量与 p50/p99 延迟，以及实际到达桩服务的请求数（体现请求合并与缓存效果）
+
+用法（在 AstrBot 根目录执行）：
+    python -m data.plugins.astrbot_plugin_music_search.benchmarks.run
+    python -m data.plugins.astrbot_plugin_music_search.benchmarks.run --concurrency 1,16,64 --requests 1000 \\
+        --latency-ms 80 --error-rate 0.05 --distinct 50 --cache --json result.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+
+from astrbot.api import logger
+
+from ..api import RESULT_CHECKS, CachedSearchAPI, MusicSearcher, NetEaseMusicAPINodeJs
+from ..net import HttpClient
+from .stub_server import StubConfig, StubServer
+
+# 各后端支持的测量方法
+BACKEND_METHODS = {
+    "nodejs": ("fetch_data", "fetch_extra", "fetch_lyrics", "fetch_comments"),
+    "txqq": ("fetch_data",),
+}
+
+
+@dataclass
+class CaseResult:
+    backend: str
+    method: str
+    concurrency: int
+    requests: int
+    ok: int
+    upstream: int  # 桩服务实际收到的请求数（含重试，不含请求合并/缓存命中）
+    elapsed: float
+    throughput: float
+    p50_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """最近秩分位数（ordered 需已排序）"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def create_backend(name: str, stub: StubServer, http: HttpClient, cache: bool):
+    if name == "nodejs":
+        backend = NetEaseMusicAPINodeJs(base_url=stub.nodejs_url, http=http)
+    elif name == "txqq":
+        backend = MusicSearcher(http=http)
+        backend.base_url = stub.txqq_url
+        backend.health_urls = [stub.txqq_url]
+    else:
+        raise ValueError(f"未知的后端: {name}")
+    return CachedSearchAPI(backend) if cache else backend
+
+
+async def run_case(stub: StubServer, args, backend_name: str, method: str, concurrency: int) -> CaseResult:
+    """以固定并发数发起 args.requests 次调用（第 i 次使用第 i % distinct 个关键词/歌曲 ID）"""
+    http = HttpClient(
+        limit=args.pool_limit,
+        limit_per_host=args.pool_limit_per_host,
+        retries=args.retries,
+        breaker_threshold=args.breaker_threshold,
+    )
+    backend = create_backend(backend_name, stub, http, args.cache)
+    call = getattr(backend, method)
+    is_valid = RESULT_CHECKS[method][0]
+    distinct = args.distinct or args.requests
+    indices = iter(range(args.requests))
+    latencies: list[float] = []
+    ok = 0
+
+    async def worker():
+        nonlocal ok
+        for i in indices:
+            key = f"基准歌曲{i % distinct}" if method == "fetch_data" else 100000 + i % distinct
+            start = time.perf_counter()
+            try:
+                result = await call(key)
+            except Exception:
+                result = None
+            latencies.append(time.perf_counter() - start)
+            if result is not None and is_valid(result):
+                ok += 1
+
+    upstream_before = sum(stub.requests.values())
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        elapsed = time.perf_counter() - started
+        await backend.close()
+        await http.close()
+    latencies.sort()
+    return CaseResult(
+        backend=backend_name,
+        method=method,
+        concurrency=concurrency,
+        requests=len(latencies),
+        ok=ok,
+        upstream=sum(stub.requests.values()) - upstream_before,
+        elapsed=round(elapsed, 3),
+        throughput=round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        p50_ms=round(percentile(latencies, 0.5) * 1000, 1),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 1),
+        max_ms=round(latencies[-1] * 1000, 1) if latencies else 0.0,
+    )
+
+
+TABLE_HEADER = (
+    f"{'backend':<8} {'method':<15} {'conc':>5} {'reqs':>6} {'ok':>6} {'upstream':>8}"
+    f" {'req/s':>9} {'p50ms':>8} {'p99ms':>8} {'maxms':>8}"
+)
+
+
+def format_row(r: CaseResult) -> str:
+    return (
+        f"{r.backend:<8} {r.method:<15} {r.concurrency:>5} {r.requests:>6} {r.ok:>6} {r.upstream:>8}"
+        f" {r.throughput:>9.1f} {r.p50_ms:>8.1f} {r.p99_ms:>8.1f} {r.max_ms:>8.1f}"
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="点歌插件 API 客户端离线基准测试（本地桩服务，不访问外网）")
+    parser.add_argument("--backends", default="nodejs,txqq", help="逗号分隔：nodejs,txqq")
+    parser.add_argument("--methods", default="", help="逗号分隔的方法名，留空测量后端支持的全部方法")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="逐级并发数，逗号分隔")
+    parser.add_argument("--requests", type=int, default=200, help="每个用例的调用次数")
+    parser.add_argument("--distinct", type=int, default=0, help="不同关键词/歌曲 ID 的数量，0=每次调用都不同")
+    parser.add_argument("--cache", action="store_true", help="用 CachedSearchAPI 包装后端（缓存 fetch_data）")
+    # 桩服务行为
+    parser.add_argument("--latency-ms", type=float, default=50, help="桩服务固定延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="桩服务额外随机延迟上限（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="桩服务返回错误的比例（0~1）")
+    parser.add_argument("--error-status", type=int, default=500, help="桩服务错误响应的状态码")
+    parser.add_argument("--songs", type=int, default=5, help="搜索结果条数")
+    parser.add_argument("--lyric-lines", type=int, default=40, help="歌词行数")
+    parser.add_argument("--comments", type=int, default=10, help="热评条数")
+    parser.add_argument("--comment-length", type=int, default=60, help="每条热评的字数")
+    parser.add_argument("--audio-size", type=int, default=8 * 1024 * 1024, help="音频地址返回的文件字节数")
+    parser.add_argument("--seed", type=int, default=None, help="桩服务随机种子（延迟抖动与错误注入）")
+    # 客户端设置
+    parser.add_argument("--pool-limit", type=int, default=100, help="连接池总连接数")
+    parser.add_argument("--pool-limit-per-host", type=int, default=10, help="连接池单主机连接数")
+    parser.add_argument("--retries", type=int, default=2, help="幂等请求重试次数")
+    parser.add_argument("--breaker-threshold", type=int, default=5, help="熔断连续失败阈值")
+    parser.add_argument("--json", default="", help="将结果写入 JSON 文件")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出插件日志（默认只输出结果表）")
+    return parser.parse_args(argv)
+
+
+async def main(argv=None) -> list[CaseResult]:
+    args = parse_args(argv)
+    if not args.verbose:
+        logger.setLevel(logging.CRITICAL)
+    stub = StubServer(StubConfig(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        songs=args.songs,
+        lyric_lines=args.lyric_lines,
+        comments=args.comments,
+        comment_length=args.comment_length,
+        audio_size=args.audio_size,
+        seed=args.seed,
+    ))
+    await stub.start()
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    wanted = {method.strip() for method in args.methods.split(",") if method.strip()}
+    results = []
+    print(TABLE_HEADER)
+    print("-" * len(TABLE_HEADER))
+    try:
+        for backend_name in (name.strip() for name in args.backends.split(",") if name.strip()):
+            for method in BACKEND_METHODS[backend_name]:
+                if wanted and method not in wanted:
+                    continue
+                for concurrency in levels:
+                    results.append(await run_case(stub, args, backend_name, method, concurrency))
+                    print(format_row(results[-1]), flush=True)
+    finally:
+        await stub.close()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"stub": asdict(stub.config), "results": [asdict(r) for r in results]},
+                f, ensure_ascii=False, indent=2,
+            )
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
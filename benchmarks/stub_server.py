@@ -0,0 +1,189 @@
+import asyncio
+import json
+import random
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+
+from aiohttp import web
+
+
+@dataclass
+class StubConfig:
+    """
+    桩服务行为配置
+    - latency / jitter: 每个请求的固定延迟与额外随机延迟上限（秒）
+    - error_rate / error_status: 按比例返回错误状态码（默认 500，会触发客户端重试与熔断）
+    - songs / lyric_lines / comments / comment_length: 响应体大小（搜索结果数、歌词行数、热评条数与每条长度）
+    - audio_size: /audio/{name} 返回的音频文件字节数（支持 Range 分段请求）
+    """
+    latency: float = 0.05
+    jitter: float = 0.02
+    error_rate: float = 0.0
+    error_status: int = 500
+    songs: int = 5
+    lyric_lines: int = 40
+    comments: int = 10
+    comment_length: int = 60
+    audio_size: int = 8 * 1024 * 1024
+    seed: int | None = None
+
+
+class StubServer:
+    """
+    网易云 NodeJS API（/search、/song/url、/lyric、/comment/hot）、txqq 搜索接口（POST /txqq/）
+    与二者返回的音频地址（/audio/{name}）的本地桩
+    响应结构与真实接口一致，内容按关键词/歌曲 ID 确定性生成；requests 按路由统计收到的请求数
+    """
+    def __init__(self, config: StubConfig | None = None):
+        self.config = config or StubConfig()
+        self.random = random.Random(self.config.seed)
+        self.requests: Counter[str] = Counter()
+        self._runner: web.AppRunner | None = None
+        self._audio_body = b""
+        self.base_url = ""
+
+    @property
+    def nodejs_url(self) -> str:
+        return self.base_url + "/"
+
+    @property
+    def txqq_url(self) -> str:
+        return self.base_url + "/txqq/"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """启动服务（port=0 时随机分配端口），返回基础地址"""
+        app = web.Application()
+        app.router.add_route("*", "/search", self._search)
+        app.router.add_route("*", "/song/url", self._song_url)
+        app.router.add_route("*", "/lyric", self._lyric)
+        app.router.add_route("*", "/comment/hot", self._hot_comments)
+        app.router.add_post("/txqq/", self._txqq_search)
+        app.router.add_get("/audio/{name}", self._audio)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _params(self, request: web.Request) -> dict:
+        """合并查询参数与请求体（JSON 或表单）"""
+        params = dict(request.query)
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                try:
+                    params.update(await request.json())
+                except json.JSONDecodeError:
+                    pass
+            else:
+                params.update(await request.post())
+        return params
+
+    async def _simulate(self, route: str) -> web.Response | None:
+        """记录请求、模拟延迟；命中错误率时返回错误响应"""
+        self.requests[route] += 1
+        config = self.config
+        await asyncio.sleep(config.latency + self.random.uniform(0, config.jitter))
+        if config.error_rate > 0 and self.random.random() < config.error_rate:
+            return web.json_response({"code": config.error_status, "msg": "stub error"}, status=config.error_status)
+        return None
+
+    def _song(self, keyword: str, index: int) -> dict:
+        song_id = zlib.crc32(f"{keyword}\0{index}".encode()) % 10**9 + 1
+        return {
+            "id": song_id,
+            "name": f"{keyword}-{index}",
+            "artists": [{"id": index, "name": f"歌手{index}"}],
+            "duration": 180000 + index * 1000,
+        }
+
+    async def _search(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        if (error := await self._simulate("search")) is not None:
+            return error
+        keyword = str(params.get("keywords", ""))
+        limit = min(int(params.get("limit", self.config.songs)), self.config.songs)
+        songs = [self._song(keyword, i) for i in range(limit)]
+        return web.json_response({"code": 200, "result": {"songs": songs, "songCount": len(songs)}})
+
+    async def _song_url(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        if (error := await self._simulate("song_url")) is not None:
+            return error
+        ids = str(params.get("ids") or params.get("id") or "").split(",")
+        br = int(params.get("br", 320000))
+        data = [
+            {"id": int(song_id), "url": f"{self.base_url}/audio/{song_id}.mp3", "br": br, "size": self.config.audio_size}
+            for song_id in ids if song_id.isdigit()
+        ]
+        return web.json_response({"code": 200, "data": data})
+
+    async def _lyric(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        if (error := await self._simulate("lyric")) is not None:
+            return error
+        song_id = params.get("id", "0")
+        lines = "\n".join(
+            f"[{i // 60:02d}:{i % 60:02d}.00]第{i + 1}行歌词 {song_id}" for i in range(self.config.lyric_lines)
+        )
+        return web.json_response({"code": 200, "lrc": {"version": 1, "lyric": lines}})
+
+    async def _hot_comments(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        if (error := await self._simulate("comment_hot")) is not None:
+            return error
+        song_id = params.get("id", "0")
+        content = "评" * self.config.comment_length
+        comments = [
+            {"commentId": i, "user": {"nickname": f"用户{i}"}, "content": f"{song_id}:{content}", "likedCount": 1000 - i}
+            for i in range(self.config.comments)
+        ]
+        return web.json_response({"code": 200, "hotComments": comments, "total": len(comments)})
+
+    async def _txqq_search(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        if (error := await self._simulate("txqq")) is not None:
+            return error
+        keyword = str(params.get("input", ""))
+        songs = [
+            {
+                "songid": song["id"],
+                "title": song["name"],
+                "author": song["artists"][0]["name"],
+                "url": f"{self.base_url}/audio/{song['id']}.mp3",
+                "link": f"https://music.163.com/#/song?id={song['id']}",
+                "lrc": "[00:00.00]stub",
+                "pic": "",
+            }
+            for song in (self._song(keyword, i) for i in range(self.config.songs))
+        ]
+        return web.json_response({"code": 200, "data": songs, "songs": songs})
+
+    async def _audio(self, request: web.Request) -> web.Response:
+        if (error := await self._simulate("audio")) is not None:
+            return error
+        if len(self._audio_body) != self.config.audio_size:
+            self._audio_body = (bytes(range(256)) * (self.config.audio_size // 256 + 1))[:self.config.audio_size]
+        body = self._audio_body
+        try:
+            byte_range = request.http_range
+        except ValueError:
+            raise web.HTTPRequestRangeNotSatisfiable(headers={"Content-Range": f"bytes */{len(body)}"})
+        if "Range" not in request.headers:
+            return web.Response(body=body, content_type="audio/mpeg", headers={"Accept-Ranges": "bytes"})
+        start, stop, _ = byte_range.indices(len(body))
+        if start >= stop:
+            raise web.HTTPRequestRangeNotSatisfiable(headers={"Content-Range": f"bytes */{len(body)}"})
+        return web.Response(
+            body=body[start:stop],
+            status=206,
+            content_type="audio/mpeg",
+            headers={"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{stop - 1}/{len(body)}"},
+        )
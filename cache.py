@@ -0,0 +1,386 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import aiofiles
+from astrbot.api import logger
+
+
+def normalize_key(text: str) -> str:
+    """缓存键归一化：全半角统一、折叠空白、忽略大小写"""
+    return " ".join(unicodedata.normalize("NFKC", text).split()).casefold()
+
+
+class TTLCache:
+    """
+    带过期时间的 LRU 缓存（条目数上限 + TTL，支持按条目指定 TTL）
+    """
+    def __init__(self, maxsize: int = 512, ttl: float = 600):
+        self.maxsize = max(0, int(maxsize))
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()  # key -> (过期时间, 值)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value, ttl: float | None = None):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class LRUBytesCache:
+    """
+    按字节预算淘汰的内存 LRU 缓存（值为 bytes）
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[str, bytes] = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str) -> bytes | None:
+        data = self._data.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        # 单个条目超出总预算时不缓存，避免清空整个缓存
+        if len(data) > self.max_bytes:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.total_bytes -= len(old)
+        self._data[key] = data
+        self.total_bytes += len(data)
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.total_bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CommentPoolCache:
+    """
+    歌曲热评池缓存：按歌曲 ID 缓存热评内容列表，请求时在本地随机抽取
+    - ttl 内视为新鲜；过期但未超过 max_stale 时仍返回旧评论池并标记需要刷新（由调用方在后台刷新）
+    - max_comments: 缓存的评论总条数上限，超出时按 LRU 淘汰整首歌的评论池
+    """
+    def __init__(self, max_comments: int = 5000, ttl: float = 86400, max_stale: float = 604800):
+        self.max_comments = max(0, int(max_comments))
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.total_comments = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()  # song_id -> (写入时间, 评论列表)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, song_id) -> tuple[list[str] | None, bool]:
+        """返回 (评论池, 是否需要刷新)；未缓存或过旧时返回 (None, True)"""
+        key = str(song_id)
+        item = self._data.get(key)
+        age = time.monotonic() - item[0] if item is not None else None
+        if item is None or age > self.ttl + self.max_stale:
+            if item is not None:
+                self._remove(key)
+            self.misses += 1
+            return None, True
+        self._data.move_to_end(key)
+        if age > self.ttl:
+            self.stale_hits += 1
+            return item[1], True
+        self.hits += 1
+        return item[1], False
+
+    def put(self, song_id, comments: list[str]):
+        if self.max_comments <= 0 or not comments:
+            return
+        key = str(song_id)
+        comments = list(comments[:self.max_comments])
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (time.monotonic(), comments)
+        self.total_comments += len(comments)
+        while self.total_comments > self.max_comments and len(self._data) > 1:
+            self._remove(next(iter(self._data)))
+
+    def _remove(self, key: str):
+        _, comments = self._data.pop(key)
+        self.total_comments -= len(comments)
+
+    def stats(self) -> dict:
+        total = self.hits + self.stale_hits + self.misses
+        return {
+            "songs": len(self._data),
+            "comments": self.total_comments,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / total, 3) if total else 0.0,
+        }
+
+
+class LyricImageCache:
+    """
+    歌词图片两级缓存：内存 LRU（字节预算）+ 可选磁盘存储
+    缓存键 = 歌曲ID + 渲染参数哈希 + 歌词文本哈希，歌词内容变化后旧图片不再命中；
+    磁盘文件索引在启动时扫描一次，之后增量维护，超出配额时按最近使用淘汰。
+    """
+    def __init__(self, max_memory_bytes: int, disk_dir: Path | None = None, max_disk_bytes: int = 0):
+        self.memory = LRUBytesCache(max_memory_bytes)
+        self.disk_dir = disk_dir if disk_dir and max_disk_bytes > 0 else None
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_hits = 0
+        self.disk_bytes = 0
+        self._disk_index: OrderedDict[str, int] = OrderedDict()  # 缓存键 -> 文件大小（按最近使用排序）
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._scan()
+
+    def _scan(self):
+        """扫描磁盘缓存目录重建索引（按修改时间排序，近似最近使用顺序），清理残留的临时文件"""
+        for tmp in self.disk_dir.glob("*.tmp"):
+            tmp.unlink(missing_ok=True)
+        files = sorted(
+            ((p, p.stat()) for p in self.disk_dir.glob("*.jpg")),
+            key=lambda item: item[1].st_mtime,
+        )
+        for path, st in files:
+            self._disk_index[path.stem] = st.st_size
+            self.disk_bytes += st.st_size
+
+    @staticmethod
+    def params_key(**params) -> str:
+        """渲染参数（宽度、字号、颜色等）的稳定哈希"""
+        raw = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.md5(raw.encode()).hexdigest()[:12]
+
+    @staticmethod
+    def make_key(song_id, params_key: str, lyrics: str) -> str:
+        lyric_hash = hashlib.sha1(lyrics.encode()).hexdigest()[:16]
+        return f"{_safe_name(song_id)}_{params_key}_{lyric_hash}"
+
+    async def get(self, song_id, params_key: str, lyrics: str) -> bytes | None:
+        """
+        按歌词内容精确查询缓存
+        :return: JPEG 字节流，未命中返回 None
+        """
+        key = self.make_key(song_id, params_key, lyrics)
+        data = self.memory.get(key)
+        if data is not None:
+            return data
+        if not self.disk_dir or key not in self._disk_index:
+            return None
+
+        path = self.disk_dir / f"{key}.jpg"
+        try:
+            async with aiofiles.open(path, "rb") as f:
+                data = await f.read()
+            os.utime(path)  # 刷新修改时间，重启后重建索引时保持最近使用顺序
+        except OSError as e:
+            logger.error(f"歌词图片磁盘缓存读取失败: {str(e)}")
+            self.disk_bytes -= self._disk_index.pop(key, 0)
+            return None
+
+        self._disk_index.move_to_end(key)
+        self.disk_hits += 1
+        self.memory.put(key, data)
+        return data
+
+    async def put(self, song_id, params_key: str, lyrics: str, data: bytes):
+        """写入缓存（内存 + 磁盘）"""
+        key = self.make_key(song_id, params_key, lyrics)
+        self.memory.put(key, data)
+        if not self.disk_dir:
+            return
+
+        path = self.disk_dir / f"{key}.jpg"
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                await f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"歌词图片磁盘缓存写入失败: {str(e)}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        self.disk_bytes += len(data) - self._disk_index.pop(key, 0)
+        self._disk_index[key] = len(data)
+        await self._prune_disk(keep=key)
+
+    async def _prune_disk(self, keep: str):
+        """磁盘占用超出配额时按最近使用顺序淘汰旧图片（删除文件在线程中执行）"""
+        victims = []
+        for key in list(self._disk_index):
+            if self.disk_bytes <= self.max_disk_bytes:
+                break
+            if key == keep:
+                continue
+            self.disk_bytes -= self._disk_index.pop(key)
+            victims.append(self.disk_dir / f"{key}.jpg")
+        if victims:
+            await asyncio.to_thread(_unlink_all, victims)
+
+    def stats(self) -> dict:
+        return {**self.memory.stats(), "disk_hits": self.disk_hits, "disk_files": len(self._disk_index)}
+
+
+def _unlink_all(paths: list[Path]):
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+def _safe_name(value) -> str:
+    """过滤文件名中的特殊字符"""
+    return "".join(c for c in str(value) if c.isalnum() or c in ("_", "-")) or "0"
+
+
+class AudioCache:
+    """
+    音频文件磁盘缓存：文件按 (歌曲ID, 码率) 命名，超出配额时按最近使用淘汰。
+    写入采用 临时文件 + 重命名，启动时扫描目录重建索引并清理残留的临时文件。
+    正在发送的文件通过 lease() 占用，淘汰时跳过，待占用释放后再按配额补做淘汰。
+    """
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max(0, int(max_bytes))
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._index: OrderedDict[str, int] = OrderedDict()  # 文件名 -> 大小（按最近使用排序）
+        self._leases: Counter[str] = Counter()  # 文件名 -> 占用数
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """扫描缓存目录重建索引（按修改时间排序，近似最近使用顺序）"""
+        for part in self.cache_dir.glob("*.part"):
+            part.unlink(missing_ok=True)
+        files = sorted(
+            ((p, p.stat()) for p in self.cache_dir.glob("*.mp3")),
+            key=lambda item: item[1].st_mtime,
+        )
+        for path, st in files:
+            self._index[path.name] = st.st_size
+            self.total_bytes += st.st_size
+        self._evict()
+        logger.info(f"音频缓存索引完成 | 文件数: {len(self._index)} | 占用: {self.total_bytes / 1024 / 1024:.1f}MB")
+
+    @staticmethod
+    def make_name(song_id, bitrate) -> str:
+        return f"{_safe_name(song_id)}_{_safe_name(bitrate)}.mp3"
+
+    def get(self, song_id, bitrate) -> Path | None:
+        """命中时返回缓存文件路径并刷新其使用时间"""
+        name = self.make_name(song_id, bitrate)
+        path = self.cache_dir / name
+        if name in self._index and path.is_file():
+            self._index.move_to_end(name)
+            os.utime(path)
+            self.hits += 1
+            return path
+        if name in self._index:
+            self.total_bytes -= self._index.pop(name)
+        self.misses += 1
+        return None
+
+    @contextmanager
+    def lease(self, song_id, bitrate):
+        """占用 (歌曲ID, 码率) 对应的缓存文件，占用期间不会被淘汰（文件可以尚未下载）"""
+        name = self.make_name(song_id, bitrate)
+        self._leases[name] += 1
+        try:
+            yield
+        finally:
+            self._leases[name] -= 1
+            if self._leases[name] <= 0:
+                del self._leases[name]
+                if self.total_bytes > self.max_bytes:
+                    self._evict()
+
+    def temp_path(self, song_id, bitrate) -> Path:
+        """下载用的临时文件路径（同一歌曲的并发下载互不覆盖）"""
+        return self.cache_dir / f"{self.make_name(song_id, bitrate)}.{os.urandom(4).hex()}.part"
+
+    def commit(self, temp_path: Path, song_id, bitrate) -> Path:
+        """将下载完成的临时文件原子性地移入缓存，并按配额淘汰旧文件"""
+        name = self.make_name(song_id, bitrate)
+        path = self.cache_dir / name
+        os.replace(temp_path, path)
+        if name in self._index:
+            self.total_bytes -= self._index.pop(name)
+        self._index[name] = path.stat().st_size
+        self.total_bytes += self._index[name]
+        self._evict(keep=name)
+        return path
+
+    def _evict(self, keep: str | None = None):
+        for name in list(self._index):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if name == keep or name in self._leases:
+                continue
+            self.total_bytes -= self._index.pop(name)
+            (self.cache_dir / name).unlink(missing_ok=True)
+            logger.debug(f"音频缓存淘汰: {name}")
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._index),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "leased": len(self._leases),
+        }
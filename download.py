@@ -0,0 +1,225 @@
+import asyncio
+import os
+import random
+import re
+import time
+from pathlib import Path
+
+import aiofiles
+import aiohttp
+from astrbot.api import logger
+
+from .net import HttpClient, RetryableStatusError
+from .tracing import span
+
+CONTENT_RANGE_RE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+# 可恢复的传输错误（断线、读超时、响应体不完整、5xx/429），出现时从已写入位置续传
+TRANSIENT_ERRORS = (
+    aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError, RetryableStatusError
+)
+
+
+def _raise_for_retryable(response: aiohttp.ClientResponse):
+    """5xx/429 视为暂时性错误（可重试），其余状态码交给调用方判断"""
+    if response.status >= 500 or response.status == 429:
+        raise RetryableStatusError(
+            response.request_info, response.history, status=response.status, message=response.reason or ""
+        )
+
+
+class DownloadError(RuntimeError):
+    """下载失败（重试耗尽、服务器响应异常或大小校验不通过）"""
+
+
+class SegmentedDownloader:
+    """
+    分段并行下载器：
+    - 服务器支持 Range 时按 segments 段并行下载，各段写入预分配文件的对应位置
+    - 传输中断后按已写入的字节数发起 Range 续传，每段最多重试 retries 次（指数退避）
+    - 不支持 Range（或 206 响应未给出总大小）的服务器退化为单连接下载，失败时从头重试
+    - 完成后校验文件大小；进度日志按 progress_interval 秒节流输出
+    - 单次读取超过 stall_timeout 秒无数据视为中断；整体耗时受 HttpClient 的 download 超时限制
+    """
+    def __init__(
+        self,
+        http: HttpClient,
+        segments: int = 4,
+        min_segment_size: int = 1024 * 1024,
+        retries: int = 3,
+        stall_timeout: float = 15,
+        chunk_size: int = 64 * 1024,
+        progress_interval: float = 2.0,
+    ):
+        self.http = http
+        self.segments = max(1, int(segments))
+        self.min_segment_size = min_segment_size
+        self.retries = max(0, int(retries))
+        self.stall_timeout = stall_timeout
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+
+    def _timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=None, sock_connect=self.stall_timeout, sock_read=self.stall_timeout)
+
+    async def download(self, url: str, dest: Path) -> int:
+        """下载 url 到 dest（覆盖写入），返回文件大小"""
+        with span("http_download", url=url) as trace_attrs:
+            size = await asyncio.wait_for(self._download(url, Path(dest)), self.http.timeouts["download"])
+            if trace_attrs is not None:
+                trace_attrs["bytes"] = size
+            return size
+
+    async def _download(self, url: str, dest: Path) -> int:
+        progress = _Progress(self.progress_interval)
+        # 探测：请求第一个字节，206 且带有总大小说明支持分段下载；探测同样按暂时性错误重试
+        total = None
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.http.session.get(
+                    url, headers={"Range": "bytes=0-0"}, timeout=self._timeout()
+                ) as response:
+                    _raise_for_retryable(response)
+                    response.raise_for_status()
+                    if response.status == 206:
+                        match = CONTENT_RANGE_RE.match(response.headers.get("Content-Range", ""))
+                        if match and match.group(3) != "*":
+                            total = int(match.group(3))
+                        break
+                    # 服务器忽略了 Range：直接使用本次响应单连接下载
+                    progress.reset()
+                    progress.total = int(response.headers.get("Content-Length", 0))
+                    async with aiofiles.open(dest, "wb") as f:
+                        await self._copy(response, f, progress)
+                return self._verify(dest, progress.total)
+            except TRANSIENT_ERRORS as e:
+                if attempt >= self.retries:
+                    raise DownloadError(f"下载失败，重试次数已用尽: {str(e) or type(e).__name__}") from e
+                logger.warning(f"下载请求中断，重新请求（{attempt + 1}/{self.retries}）| 错误: {str(e) or type(e).__name__}")
+                await self._backoff(attempt)
+        if total is None:
+            # 206 但总大小未知：丢弃探测得到的 1 字节，单连接下载完整文件
+            return await self._download_plain(url, dest, progress)
+
+        progress.total = total
+        count = max(1, min(self.segments, total // self.min_segment_size))
+        size = -(-total // count)
+        with open(dest, "wb") as f:
+            f.truncate(total)  # 预分配，各段按偏移写入
+        tasks = [
+            asyncio.create_task(self._fetch_segment(url, dest, start, min(start + size, total) - 1, progress))
+            for start in range(0, total, size)
+        ]
+        try:
+            written = sum(await asyncio.gather(*tasks))
+        finally:
+            for task in tasks:  # 任一分段失败时取消其余分段
+                task.cancel()
+        progress.report(force=True)
+        # 文件已预分配为 total 大小，需按各分段实际写入的字节数校验
+        if written != total:
+            raise DownloadError(f"分段下载字节数校验失败: 实际写入{written}字节，预期{total}字节")
+        return self._verify(dest, total)
+
+    async def _download_plain(self, url: str, dest: Path, progress: "_Progress") -> int:
+        """单连接下载（服务器不支持 Range 或未返回总大小时使用，失败从头重试）"""
+        for attempt in range(self.retries + 1):
+            progress.reset()
+            try:
+                async with self.http.session.get(url, timeout=self._timeout()) as response:
+                    _raise_for_retryable(response)
+                    response.raise_for_status()
+                    progress.total = int(response.headers.get("Content-Length", 0))
+                    async with aiofiles.open(dest, "wb") as f:
+                        await self._copy(response, f, progress)
+                return self._verify(dest, progress.total)
+            except TRANSIENT_ERRORS as e:
+                if attempt >= self.retries:
+                    raise DownloadError(f"下载失败，重试次数已用尽: {str(e) or type(e).__name__}") from e
+                await self._backoff(attempt)
+
+    async def _fetch_segment(self, url: str, dest: Path, start: int, end: int, progress: "_Progress"):
+        """下载一个分段（单独记录追踪片段，便于定位慢分段）"""
+        with span("http_range", start=start, end=end) as trace_attrs:
+            written = await self._fetch_range(url, dest, start, end, progress)
+            if trace_attrs is not None:
+                trace_attrs["bytes"] = written
+            return written
+
+    async def _fetch_range(self, url: str, dest: Path, start: int, end: int, progress: "_Progress"):
+        """
+        下载 [start, end] 区间，中断或 5xx/429 后从已写入位置续传，返回实际写入的字节数；
+        返回 200（忽略了 Range）或其他 4xx 时直接失败
+        """
+        position = start
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.http.session.get(
+                    url, headers={"Range": f"bytes={position}-{end}"}, timeout=self._timeout()
+                ) as response:
+                    if response.status != 206:
+                        _raise_for_retryable(response)
+                        raise DownloadError(f"分段请求未返回 206（状态码 {response.status}）")
+                    async with aiofiles.open(dest, "r+b") as f:
+                        await f.seek(position)
+                        # 逐块推进写入位置，中断时从实际写入处续传
+                        async for chunk in response.content.iter_chunked(self.chunk_size):
+                            chunk = chunk[:end - position + 1]
+                            await f.write(chunk)
+                            position += len(chunk)
+                            progress.add(len(chunk))
+                            if position > end:
+                                break
+                if position > end:
+                    return position - start
+                raise aiohttp.ClientPayloadError(f"分段数据不完整: {position - start}/{end - start + 1} 字节")
+            except TRANSIENT_ERRORS as e:
+                if attempt >= self.retries:
+                    raise DownloadError(f"分段 {start}-{end} 下载失败，重试次数已用尽: {str(e) or type(e).__name__}") from e
+                logger.warning(
+                    f"分段下载中断，从 {position} 字节处续传（{attempt + 1}/{self.retries}）| 错误: {str(e) or type(e).__name__}"
+                )
+                await self._backoff(attempt)
+
+    async def _copy(self, response: aiohttp.ClientResponse, f, progress: "_Progress"):
+        """将完整响应体写入文件"""
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            await f.write(chunk)
+            progress.add(len(chunk))
+
+    @staticmethod
+    async def _backoff(attempt: int):
+        await asyncio.sleep(0.5 * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    @staticmethod
+    def _verify(dest: Path, expected: int) -> int:
+        size = os.path.getsize(dest)
+        if size == 0 or (expected > 0 and size != expected):
+            raise DownloadError(f"文件大小校验失败: 实际{size}字节，预期{expected}字节")
+        return size
+
+
+class _Progress:
+    """下载进度统计（按时间间隔节流输出日志）"""
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.total = 0
+        self.reset()
+
+    def reset(self):
+        self.done = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def add(self, count: int):
+        self.done += count
+        self.report()
+
+    def report(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        speed = self.done / max(now - self.started, 1e-6) / 1024
+        percent = f"{self.done * 100 / self.total:.0f}%" if self.total else "未知"
+        logger.debug(f"下载进度: {self.done}/{self.total or '?'} 字节（{percent}）| {speed:.0f} KB/s")
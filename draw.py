@@ -1,6 +1,9 @@
+import inspect
 import io
 from pathlib import Path
 import re
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
 from PIL import Image, ImageDraw, ImageFont
 import asyncio
 import aiohttp
@@ -10,9 +13,96 @@ from bs4 import BeautifulSoup
 import hashlib
 from astrbot import logger
 
+from .net import HttpClient
+from .tracing import span
+
 
 font_path = Path("data/plugins/astrbot_plugin_music_search/simhei.ttf")
 
+# 渐变背景高度分桶粒度（同一桶内的歌词图共用一条缓存颜色列）
+GRADIENT_HEIGHT_BUCKET = 256
+
+# 歌词图尺寸上限：超长歌词在提交渲染前截断，避免单次渲染长时间占用工作线程/进程；
+# JPEG 单边不能超过 65535 像素
+MAX_LYRIC_LINES = 400
+MAX_LYRIC_LINE_CHARS = 120
+MAX_IMAGE_HEIGHT = 65000
+
+
+@lru_cache(maxsize=32)
+def _gradient_column(bucket_height: int, top_color: tuple, bottom_color: tuple) -> Image.Image:
+    """生成指定桶高度、1 像素宽的竖向渐变颜色列（缓存只占 3×高度 字节）"""
+    column = Image.new("RGB", (1, bucket_height))
+    column.putdata(
+        [
+            tuple(
+                int(top * (1 - y / bucket_height) + bottom * (y / bucket_height))
+                for top, bottom in zip(top_color, bottom_color)
+            )
+            for y in range(bucket_height)
+        ]
+    )
+    return column
+
+
+def gradient_background(
+    width: int, height: int, top_color: tuple, bottom_color: tuple
+) -> Image.Image:
+    """
+    获取竖向渐变背景（返回可直接绘制的新图像）。
+    按 (高度桶, 颜色) 缓存 1 像素宽的颜色列，每次拉伸到实际宽高。
+    """
+    bucket_height = max(
+        GRADIENT_HEIGHT_BUCKET,
+        -(-height // GRADIENT_HEIGHT_BUCKET) * GRADIENT_HEIGHT_BUCKET,
+    )
+    column = _gradient_column(bucket_height, tuple(top_color), tuple(bottom_color))
+    if bucket_height == height:
+        return column.resize((width, height), Image.NEAREST)
+    return column.resize((width, height), Image.BILINEAR)
+
+
+# LRC 时间戳，如 [01:23.45]
+LRC_TIMESTAMP_RE = re.compile(r"\[\d{2}:\d{2}(?:\.\d{2,3})?\]")
+
+
+@lru_cache(maxsize=16)
+def load_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    """加载字体（每个 字体/字号 在进程内只加载一次）"""
+    return ImageFont.truetype(path, size)
+
+
+@lru_cache(maxsize=4096)
+def measure_line(path: str, size: int, text: str) -> tuple[int, int]:
+    """测量单行文本，返回 (宽度, 高度)；结果按 字体/字号/文本 缓存"""
+    bbox = load_font(path, size).getbbox(text)
+    return bbox[2] - bbox[0], bbox[3]
+
+
+def layout_lines(
+    lines: list[str],
+    path: str,
+    size: int,
+    image_width: int,
+    line_spacing: int,
+    padding: int = 50,
+) -> tuple[list[tuple[float, int, str]], int]:
+    """
+    单遍计算居中排版。
+    :return: ([(x, y, 文本), ...], 图片总高度)，空白行以全角空格占位
+    """
+    placements = []
+    y = padding
+    for line in lines:
+        text = line if line.strip() else "　"  # 全角空格占位
+        width, height = measure_line(path, size, text)
+        placements.append(((image_width - width) / 2, y, text))
+        y += height + line_spacing
+    # 末行之后不计行距，上下各留 padding
+    total_height = y - (line_spacing if lines else 0) + padding
+    return placements, total_height
+
+
 def draw_lyrics(
     lyrics: str,
     image_width=1000,
@@ -26,44 +116,26 @@ def draw_lyrics(
     渲染歌词为图片，背景为竖向渐变色，返回 JPEG 字节流。
     """
     # 清除时间戳但保留空白行
-    lines = lyrics.splitlines()
-    cleaned_lines = []
-    for line in lines:
-        cleaned = re.sub(r"\[\d{2}:\d{2}(?:\.\d{2,3})?\]", "", line)
-        cleaned_lines.append(cleaned if cleaned != "" else "")
-
-    # 加载字体
-    font = ImageFont.truetype(font_path, font_size)
-
-    # 计算总高度
-    dummy_img = Image.new("RGB", (image_width, 1))
-    draw = ImageDraw.Draw(dummy_img)
-    line_heights = [
-        draw.textbbox((0, 0), line if line.strip() else "　", font=font)[3]
-        for line in cleaned_lines
-    ]
-    total_height = sum(line_heights) + line_spacing * (len(cleaned_lines) - 1) + 100
-
-    # 创建渐变背景图像
-    img = Image.new("RGB", (image_width, total_height))
-    for y in range(total_height):
-        ratio = y / total_height
-        r = int(top_color[0] * (1 - ratio) + bottom_color[0] * ratio)
-        g = int(top_color[1] * (1 - ratio) + bottom_color[1] * ratio)
-        b = int(top_color[2] * (1 - ratio) + bottom_color[2] * ratio)
-        for x in range(image_width):
-            img.putpixel((x, y), (r, g, b))
+    cleaned_lines = [LRC_TIMESTAMP_RE.sub("", line) for line in lyrics.splitlines()]
 
-    draw = ImageDraw.Draw(img)
+    # 一次性计算排版（字体与每行尺寸均有进程级缓存）
+    placements, total_height = layout_lines(
+        cleaned_lines, str(font_path), font_size, image_width, line_spacing, padding=50
+    )
 
-    # 绘制歌词文本（居中）
-    y = 50
-    for line, line_height in zip(cleaned_lines, line_heights):
-        text = line if line.strip() else "　"  # 全角空格占位
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        draw.text(((image_width - text_width) / 2, y), text, font=font, fill=text_color)
-        y += line_height + line_spacing
+    # 超出 JPEG 高度上限的行不再绘制
+    if total_height > MAX_IMAGE_HEIGHT:
+        placements = [p for p in placements if p[1] + font_size + 50 <= MAX_IMAGE_HEIGHT]
+        total_height = MAX_IMAGE_HEIGHT
+
+    # 创建渐变背景图像（按高度分桶缓存，避免逐像素绘制）
+    img = gradient_background(image_width, total_height, top_color, bottom_color)
+
+    # 按排版结果绘制歌词文本（居中）
+    draw = ImageDraw.Draw(img)
+    font = load_font(str(font_path), font_size)
+    for x, y, text in placements:
+        draw.text((x, y), text, font=font, fill=text_color)
 
     # 输出到字节流
     img_bytes = io.BytesIO()
@@ -73,6 +145,265 @@ def draw_lyrics(
 
 
 
+def truncate_lyrics(
+    lyrics: str, max_lines: int = MAX_LYRIC_LINES, max_chars: int = MAX_LYRIC_LINE_CHARS
+) -> str:
+    """按行数与单行字数截断歌词（超出部分以提示行代替），用于限制单次渲染的开销"""
+    lines = lyrics.splitlines()
+    truncated = len(lines) > max_lines
+    lines = [line if len(line) <= max_chars else line[:max_chars] + "…" for line in lines[:max_lines]]
+    if truncated:
+        lines.append("……（歌词过长，已截断）")
+    return "\n".join(lines)
+
+
+def lyric_render_params(**overrides) -> dict:
+    """draw_lyrics 的完整渲染参数（默认值 + 覆盖项），用于缓存键计算"""
+    params = {
+        name: param.default
+        for name, param in inspect.signature(draw_lyrics).parameters.items()
+        if param.default is not inspect.Parameter.empty
+    }
+    params.update(overrides)
+    params["font_path"] = str(font_path)
+    return params
+
+
+class RenderQueueFullError(RuntimeError):
+    """渲染队列已满（等待中的渲染任务超过上限）"""
+
+
+class RenderExecutor:
+    """
+    绘图执行器：所有 PIL 渲染都提交到线程池/进程池中执行，避免阻塞事件循环。
+    - mode: "thread" 线程池 / "process" 进程池（渲染不占用主进程的 GIL，占用内存更多）
+    - max_workers: 并行渲染数
+    - max_queue: 排队等待的渲染任务上限，超出时直接拒绝
+    - timeout: 单次渲染超时（秒）；超时只让调用方放弃等待，不影响其他渲染任务。
+      仍在执行的任务会继续占用名额直到真正结束，排队上限按实际占用计算；
+      因此歌词在提交前按行数/字数截断（truncate_lyrics），单次渲染的耗时有上限
+    """
+
+    def __init__(
+        self,
+        mode: str = "thread",
+        max_workers: int = 2,
+        max_queue: int = 8,
+        timeout: float = 30.0,
+    ):
+        self.mode = mode if mode in ("thread", "process") else "thread"
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.timeout = timeout
+        self._pending = 0
+        self.timed_out = 0
+        self._pool = self._create_pool()
+
+    def _create_pool(self):
+        if self.mode == "process":
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="music_render"
+        )
+
+    def _submit(self, call):
+        try:
+            return self._pool.submit(call)
+        except BrokenExecutor:
+            # 工作进程异常退出会使进程池不可用，重建后重新提交
+            logger.warning("渲染进程池已损坏，重建后重试")
+            self._pool = self._create_pool()
+            return self._pool.submit(call)
+
+    def _release(self):
+        self._pending -= 1
+
+    async def run(self, func, *args, **kwargs):
+        """在执行器中运行渲染函数（进程池模式下 func 及参数需可序列化）"""
+        if self._pending >= self.max_workers + self.max_queue:
+            raise RenderQueueFullError(f"渲染队列已满（{self._pending}个任务）")
+        loop = asyncio.get_running_loop()
+        job = self._submit(partial(func, *args, **kwargs))
+        self._pending += 1
+
+        def _on_done(_job):
+            # 任务真正结束（含超时后才结束、未开始即被取消）时才释放名额；回调可能在工作线程中执行
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:  # 事件循环已关闭
+                pass
+
+        job.add_done_callback(_on_done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # 尚未开始的任务会被取消；已在执行的任务继续运行到结束，不影响其他渲染
+            self.timed_out += 1
+            logger.error(f"渲染超时（{self.timeout}秒）: {getattr(func, '__name__', func)}")
+            raise
+
+    def shutdown(self):
+        """关闭执行器（插件卸载时调用）"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_default_executor: RenderExecutor | None = None
+
+
+def get_render_executor() -> RenderExecutor:
+    """获取模块默认的渲染执行器（未显式传入执行器时使用）"""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = RenderExecutor()
+    return _default_executor
+
+
+async def draw_lyrics_async(
+    lyrics: str, executor: RenderExecutor | None = None, **kwargs
+) -> bytes:
+    """draw_lyrics 的异步版本：截断超长歌词后在渲染执行器中完成绘制"""
+    return await (executor or get_render_executor()).run(draw_lyrics, truncate_lyrics(lyrics), **kwargs)
+
+
+def _format_count(count: int) -> str:
+    if count >= 10000:
+        return f"{count / 10000:.1f}万"
+    elif count >= 1000:
+        return f"{count / 1000:.1f}千"
+    return str(count)
+
+
+def _compose_video_card(
+    video: dict,
+    thumb_bytes: bytes,
+    index: int,
+    font_path: Path,
+    card_width: int,
+    card_height: int,
+    thumb_height: int,
+    corner_radius: int,
+) -> Image.Image:
+    """绘制单张视频卡片（纯 PIL 运算，在渲染执行器中运行）"""
+    font = load_font(str(font_path), 16)
+    card = Image.new("RGBA", (card_width, card_height), "#ffffff")
+    draw = ImageDraw.Draw(card)
+
+    # 封面
+    thumb = Image.open(BytesIO(thumb_bytes)).convert("RGB")
+    thumb = thumb.resize((card_width, thumb_height))
+    card.paste(thumb, (0, 0))
+
+    # 渐变黑图层
+    gradient_height = 40
+    alpha_gradient = Image.new("L", (card_width, gradient_height), color=0)
+    for y in range(gradient_height):
+        alpha = int(180 * (y / gradient_height))
+        ImageDraw.Draw(alpha_gradient).line([(0, y), (card_width, y)], fill=alpha)
+    overlay = Image.new("RGBA", (card_width, gradient_height), color=(0, 0, 0, 255))
+    overlay.putalpha(alpha_gradient)
+    card.paste(overlay, (0, thumb_height - 40), overlay)
+
+    # 播放量
+    draw.text(
+        (8, thumb_height - 20),
+        f"{_format_count(video['play'])}",
+        font=font,
+        fill="#ffffff",
+    )
+
+    # 时长
+    draw.text(
+        (card_width - 40, thumb_height - 20),
+        f"{video['duration']}",
+        font=font,
+        fill="#ffffff",
+    )
+
+    # 标题
+    raw_title = BeautifulSoup(video["title"], "html.parser").get_text()
+    title = (
+        raw_title[:18] + "\n" + raw_title[18:36] + "..."
+        if len(raw_title) > 36
+        else raw_title[:18] + "\n" + raw_title[18:]
+    )
+    draw.text((8, thumb_height + 8), title, font=font, fill="#000000")
+
+    # 作者
+    draw.text(
+        (8, thumb_height + 60),
+        f"UP {video['author']}",
+        font=font,
+        fill="#666666",
+    )
+
+    # 序号
+    draw.text(
+        (card_width - 30, card_height - 20),
+        str(index),
+        font=font,
+        fill="#666666",
+    )
+
+    # 创建圆角遮罩
+    mask = Image.new("L", (card_width, card_height), 0)
+    draw_mask = ImageDraw.Draw(mask)
+    draw_mask.rounded_rectangle(
+        (0, 0, card_width, card_height),
+        radius=corner_radius,
+        fill=255,
+    )
+    # 应用圆角遮罩
+    card.putalpha(mask)
+    return card
+
+
+def _compose_video_list(
+    cards: list,
+    cards_per_row: int,
+    card_width: int,
+    card_height: int,
+    margin: int,
+    quality: int,
+) -> bytes:
+    """拼接卡片列表并编码为 JPEG（纯 PIL 运算，在渲染执行器中运行）"""
+    # 拼接每一行（分层）
+    rows = []
+    for i in range(0, len(cards), cards_per_row):
+        row_cards = cards[i : i + cards_per_row]
+        row_width = cards_per_row * card_width + (cards_per_row + 1) * margin
+        row_img = Image.new(
+            "RGBA",
+            (row_width, card_height + 2 * margin),
+            color="#f5f5f5",
+        )
+        for j, card in enumerate(row_cards):
+            x = margin + j * (card_width + margin)
+            row_img.paste(card, (x, margin), card)
+        rows.append(row_img)
+
+    # 最终拼接所有行
+    total_width = rows[0].width
+    total_height = sum(r.height for r in rows)
+    canvas = Image.new(
+        "RGBA",
+        (total_width, total_height),
+        color="#f5f5f5",
+    )
+
+    y_offset = 0
+    for row in rows:
+        canvas.paste(row, (0, y_offset), row)
+        y_offset += row.height
+
+    # 保存 JPEG，降画质
+    final_image = Image.new("RGB", canvas.size, "#f5f5f5")
+    final_image.paste(canvas, mask=canvas.split()[3])
+
+    buffer = BytesIO()
+    final_image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
 class MusicCardRenderer:
     def __init__(
         self,
@@ -84,6 +415,8 @@ class MusicCardRenderer:
         margin: int = 16,
         corner_radius: int = 10,
         max_concurrency: int = 10,
+        executor: RenderExecutor | None = None,
+        http: HttpClient | None = None,
     ):
         self.font_path = font_path
         self.cache_dir = cache_dir
@@ -93,6 +426,8 @@ class MusicCardRenderer:
         self.margin = margin
         self.corner_radius = corner_radius
         self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.executor = executor or get_render_executor()
+        self.http = http  # 共享 HTTP 客户端（未传入时每次渲染临时建立会话）
         self.cache_dir.mkdir(parents=True, exist_ok=True)
 
     def _get_cache_path(self, url: str) -> Path:
@@ -100,117 +435,50 @@ class MusicCardRenderer:
         name = hashlib.md5(url.encode()).hexdigest() + ".jpg"
         return self.cache_dir / name
 
-    async def download_image(
-        self, url: str, session: aiohttp.ClientSession
-    ) -> Image.Image:
+    async def download_image(self, url: str, session: aiohttp.ClientSession) -> bytes:
+        """下载封面（返回原始字节，解码交给渲染执行器）"""
         cache_path = self._get_cache_path(url)
         if cache_path.exists():
-            return Image.open(cache_path).convert("RGB")
+            async with aiofiles.open(cache_path, "rb") as f:
+                return await f.read()
 
         async with self.semaphore:
-            async with session.get(url) as resp:
-                if resp.status == 200:
-                    img_bytes = await resp.read()
-                    async with aiofiles.open(cache_path, "wb") as f:
-                        await f.write(img_bytes)
-                    return Image.open(BytesIO(img_bytes)).convert("RGB")
-                raise ValueError(f"下载失败: {url}")
+            kwargs = {"timeout": self.http.timeout("image")} if self.http else {}
+            with span("http_image", url=url) as trace_attrs:
+                async with session.get(url, **kwargs) as resp:
+                    img_bytes = await resp.read() if resp.status == 200 else b""
+                    if trace_attrs is not None:
+                        trace_attrs.update(status=resp.status, bytes=len(img_bytes))
+            if resp.status == 200:
+                async with aiofiles.open(cache_path, "wb") as f:
+                    await f.write(img_bytes)
+                return img_bytes
+            raise ValueError(f"下载失败: {url}")
 
     def format_count(self, count: int) -> str:
-        if count >= 10000:
-            return f"{count / 10000:.1f}万"
-        elif count >= 1000:
-            return f"{count / 1000:.1f}千"
-        return str(count)
+        return _format_count(count)
 
     async def draw_card(
         self,
         video: dict,
-        font: ImageFont.FreeTypeFont,
         session: aiohttp.ClientSession,
         index: int,
     ) -> Image.Image:
         try:
-            card = Image.new("RGBA", (self.card_width, self.card_height), "#ffffff")
-            draw = ImageDraw.Draw(card)
-
-            # 封面
             raw_url = video.get("pic", "")
             pic_url = raw_url if raw_url.startswith("http") else ("https:" + raw_url)
-            thumb = await self.download_image(pic_url, session)
-            thumb = thumb.resize((self.card_width, self.thumb_height))
-            card.paste(thumb, (0, 0))
-
-            # 渐变黑图层
-            gradient_height = 40
-            alpha_gradient = Image.new("L", (self.card_width, gradient_height), color=0)
-            for y in range(gradient_height):
-                alpha = int(180 * (y / gradient_height))
-                ImageDraw.Draw(alpha_gradient).line(
-                    [(0, y), (self.card_width, y)], fill=alpha
-                )
-            overlay = Image.new(
-                "RGBA", (self.card_width, gradient_height), color=(0, 0, 0, 255)
+            thumb_bytes = await self.download_image(pic_url, session)
+            return await self.executor.run(
+                _compose_video_card,
+                video,
+                thumb_bytes,
+                index,
+                font_path=self.font_path,
+                card_width=self.card_width,
+                card_height=self.card_height,
+                thumb_height=self.thumb_height,
+                corner_radius=self.corner_radius,
             )
-            overlay.putalpha(alpha_gradient)
-            card.paste(overlay, (0, self.thumb_height - 40), overlay)
-
-            # 播放量
-            draw.text(
-                (8, self.thumb_height - 20),
-                f"{self.format_count(video['play'])}",
-                font=font,
-                fill="#ffffff",
-            )
-
-            # 时长
-            draw.text(
-                (self.card_width - 40, self.thumb_height - 20),
-                f"{video['duration']}",
-                font=font,
-                fill="#ffffff",
-            )
-
-            # 标题
-            raw_title = BeautifulSoup(video["title"], "html.parser").get_text()
-            title = (
-                raw_title[:18] + "\n" + raw_title[18:36] + "..."
-                if len(raw_title) > 36
-                else raw_title[:18] + "\n" + raw_title[18:]
-            )
-            draw.text((8, self.thumb_height + 8), title, font=font, fill="#000000")
-
-            # 作者
-            draw.text(
-                (8, self.thumb_height + 60),
-                f"UP {video['author']}",
-                font=font,
-                fill="#666666",
-            )
-
-            # 序号
-            draw.text(
-                (
-                    self.card_width - 30,
-                    self.card_height - 20,
-                ),
-                str(index),
-                font=font,
-                fill="#666666",
-            )
-
-            # 创建圆角遮罩
-            mask = Image.new("L", (self.card_width, self.card_height), 0)
-            draw_mask = ImageDraw.Draw(mask)
-            draw_mask.rounded_rectangle(
-                (0, 0, self.card_width, self.card_height),
-                radius=self.corner_radius,
-                fill=255,
-            )
-            # 应用圆角遮罩
-            card.putalpha(mask)
-
-            return card
         except Exception as e:
             logger.error(f"[错误] 渲染卡片失败: {e}")
             # 返回空白卡片以避免中断整个流程
@@ -219,50 +487,28 @@ class MusicCardRenderer:
     async def render_video_list_image(
         self, video_list: list, cards_per_row: int = 3, quality: int = 70
     ) -> bytes:
-        font = ImageFont.truetype(self.font_path, 16)
-
-        async with aiohttp.ClientSession() as session:
-            tasks = [
-                self.draw_card(video, font, session, index=i + 1)
-                for i, video in enumerate(video_list)
-            ]
-            cards = await asyncio.gather(*tasks)
-
-        # 拼接每一行（分层）
-        rows = []
-        for i in range(0, len(cards), cards_per_row):
-            row_cards = cards[i : i + cards_per_row]
-            row_width = (
-                cards_per_row * self.card_width + (cards_per_row + 1) * self.margin
-            )
-            row_img = Image.new(
-                "RGBA",
-                (row_width, self.card_height + 2 * self.margin),
-                color="#f5f5f5",
+        if self.http:
+            cards = await asyncio.gather(
+                *(
+                    self.draw_card(video, self.http.session, index=i + 1)
+                    for i, video in enumerate(video_list)
+                )
             )
-            for j, card in enumerate(row_cards):
-                x = self.margin + j * (self.card_width + self.margin)
-                row_img.paste(card, (x, self.margin), card)
-            rows.append(row_img)
-
-        # 最终拼接所有行
-        total_width = rows[0].width
-        total_height = sum(r.height for r in rows)
-        canvas = Image.new(
-            "RGBA",
-            (total_width, total_height),
-            color="#f5f5f5",
-        )
-
-        y_offset = 0
-        for row in rows:
-            canvas.paste(row, (0, y_offset), row)
-            y_offset += row.height
-
-        # 异步保存 JPEG，降画质
-        final_image = Image.new("RGB", canvas.size, "#f5f5f5")
-        final_image.paste(canvas, mask=canvas.split()[3])
+        else:
+            async with aiohttp.ClientSession() as session:
+                cards = await asyncio.gather(
+                    *(
+                        self.draw_card(video, session, index=i + 1)
+                        for i, video in enumerate(video_list)
+                    )
+                )
 
-        buffer = BytesIO()
-        final_image.save(buffer, format="JPEG", quality=quality)
-        return buffer.getvalue()
+        return await self.executor.run(
+            _compose_video_list,
+            cards,
+            cards_per_row,
+            card_width=self.card_width,
+            card_height=self.card_height,
+            margin=self.margin,
+            quality=quality,
+        )
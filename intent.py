@@ -0,0 +1,322 @@
+import asyncio
+import json
+import re
+
+# 意图关键词 → 意图（与 LLM 系统提示词中的意图选项保持一致）
+INTENT_KEYWORDS = {
+    "链接": "发链接",
+    "语音": "发语音",
+    "文件": "发文件",
+    "卡片": "发卡片",
+}
+# 点歌相关触发词：严格模式下既无书名号也不含这些词的消息视为非点歌消息
+DEFAULT_TRIGGER_WORDS = (
+    "听", "歌", "曲", "唱", "点", "播", "放", "来首", "来一首", "音乐",
+    "链接", "语音", "文件", "卡片", "music", "song",
+)
+# 否定词：出现时语义可能反转，交给 LLM 判断
+NEGATION_WORDS = ("不", "别", "没", "勿")
+BOOK_TITLE_RE = re.compile(r"《([^《》]+)》")
+# 明确的非点歌消息：只有标点/表情、单独的链接、指令
+NO_WORDS_RE = re.compile(r"^[\W_]*$")
+URL_ONLY_RE = re.compile(r"^https?://\S+$")
+
+
+class RuleIntentClassifier:
+    """
+    本地规则预分类器（LLM 之前的快速通道）
+    classify 返回值：
+      - ("无歌名", "无")：明确不是点歌请求，直接丢弃（只有标点/表情、单独的链接、/ 开头的指令）
+      - (歌名, 意图)：明确的点歌请求（唯一的《歌名》+ 唯一的意图关键词）
+      - None：无法确定，交给 LLM 识别
+    strict=True 时，既无书名号也不含触发词的消息也直接丢弃（更省 LLM 调用，
+    但“晴天”“周杰伦的七里香”这类只有歌名的消息会被忽略）
+    """
+    def __init__(self, trigger_words: list[str] | None = None, strict: bool = False):
+        self.trigger_words = tuple(w.casefold() for w in (trigger_words or DEFAULT_TRIGGER_WORDS))
+        self.strict = strict
+        # 统计计数
+        self.rejected = 0  # 本地判定为非点歌
+        self.accepted = 0  # 本地直接给出歌名与意图
+        self.forwarded = 0  # 交给 LLM
+        # 抽样复核计数（本地结论与 LLM 结论对比）
+        self.shadow_checked = 0
+        self.shadow_agreed = 0
+
+    def classify(self, text: str) -> tuple[str, str] | None:
+        text = text.strip()
+        titles = [t.strip() for t in BOOK_TITLE_RE.findall(text) if t.strip()]
+        lowered = text.casefold()
+
+        # 1. 明确的非点歌消息（严格模式下还包括无书名号且无任何点歌触发词的消息）
+        if (
+            NO_WORDS_RE.match(text)
+            or URL_ONLY_RE.match(text)
+            or text.startswith("/")
+            or (self.strict and not titles and not any(w in lowered for w in self.trigger_words))
+        ):
+            self.rejected += 1
+            return "无歌名", "无"
+
+        # 2. 唯一书名号 + 唯一意图关键词（歌名之外）且无否定词 → 明确请求
+        if len(titles) == 1:
+            rest = BOOK_TITLE_RE.sub("", text)
+            intents = {intent for kw, intent in INTENT_KEYWORDS.items() if kw in rest}
+            if len(intents) == 1 and not any(w in rest for w in NEGATION_WORDS):
+                self.accepted += 1
+                return titles[0], intents.pop()
+
+        # 3. 其他情况交给 LLM
+        self.forwarded += 1
+        return None
+
+    def record_shadow(self, local: tuple[str, str], llm: tuple[str, str]):
+        """记录一次抽样复核：本地结论与 LLM 结论是否一致"""
+        self.shadow_checked += 1
+        local_is_request = local[0] != "无歌名"
+        llm_is_request = llm[0] != "无歌名" and llm[1] != "无"
+        if local_is_request == llm_is_request and (
+            not local_is_request or (local[0] == llm[0] and local[1] == llm[1])
+        ):
+            self.shadow_agreed += 1
+
+    def stats(self) -> dict:
+        total = self.rejected + self.accepted + self.forwarded
+        return {
+            "rejected": self.rejected,
+            "accepted": self.accepted,
+            "forwarded": self.forwarded,
+            "llm_saved_rate": round((self.rejected + self.accepted) / total, 3) if total else 0.0,
+            "shadow_checked": self.shadow_checked,
+            "shadow_agreed": self.shadow_agreed,
+        }
+
+
+def parse_intent_reply(response_text: str) -> tuple[str, str]:
+    """解析“歌名：xxx；意图：xxx”格式的LLM回复，返回 (歌名, 意图)"""
+    song_name = "无歌名"
+    intent = "无"
+    if "歌名：" in response_text:
+        # 提取歌名部分，排除意图部分
+        song_part = response_text.split("歌名：")[-1].split("；")[0].strip()
+        # 如果歌名中包含了意图字段，需要进一步处理
+        if "意图：" in song_part:
+            song_name = song_part.split("意图：")[0].strip()
+        else:
+            song_name = song_part
+
+    if "意图：" in response_text:
+        intent = response_text.split("意图：")[-1].strip()
+    return song_name, intent
+
+
+# 精简模式：意图编号 → 意图
+INTENT_CODES = {
+    0: "无",
+    1: "默认",
+    2: "发卡片",
+    3: "发链接",
+    4: "发语音",
+    5: "发文件",
+}
+# 精简模式系统提示词：要求只输出一行 JSON，意图以编号表示
+COMPACT_SYSTEM_PROMPT = (
+    '提取用户输入中的歌名并判断意图，只输出一行JSON：{"s":"歌名","i":编号}\n'
+    's：歌名，忽略"的""一首"等停用词，保留歌名中的"-""()"等字符；没有歌名时为""\n'
+    "i：0=非点歌 1=未说明方式 2=发卡片 3=发链接 4=发语音 5=发文件\n"
+    '例：我想听《晴天》→{"s":"晴天","i":1}；'
+    '发送近藤佑輔的EmA (-狂-)用语音播放→{"s":"EmA (-狂-)","i":4}；'
+    '今天天气真好→{"s":"","i":0}'
+)
+JSON_OBJECT_RE = re.compile(r"\{[^{}]*\}")
+
+
+def parse_compact_reply(response_text: str) -> tuple[str, str] | None:
+    """严格解析精简模式的 JSON 回复，格式不符时返回 None"""
+    match = JSON_OBJECT_RE.search(response_text)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    song_name, code = data.get("s"), data.get("i")
+    if not isinstance(song_name, str) or isinstance(code, bool) or code not in INTENT_CODES:
+        return None
+    song_name = song_name.strip()
+    if not song_name or code == 0:
+        return "无歌名", "无"
+    return song_name, INTENT_CODES[code]
+
+
+class IntentReplyParser:
+    """
+    意图识别回复解析器（按提示词模式选择解析方式并统计效果）
+    - prose：原有中文长提示词，“歌名：xxx；意图：xxx”格式
+    - compact：精简提示词，JSON 格式 + 意图编号；解析失败时回退到 prose 解析
+    """
+    def __init__(self, mode: str = "prose", prose_system_prompt: str = ""):
+        self.mode = mode if mode in ("prose", "compact") else "prose"
+        self.system_prompt = COMPACT_SYSTEM_PROMPT if self.mode == "compact" else prose_system_prompt
+        self.line_example = '1. {"s":"xxx","i":1}' if self.mode == "compact" else "1. 歌名：xxx；意图：xxx"
+        # 统计计数
+        self.calls = 0
+        self.prompt_chars = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_latency = 0.0
+        self.strict_parsed = 0
+        self.fallback_parsed = 0
+
+    def record_call(self, prompt: str, latency: float, usage=None):
+        """记录一次 LLM 调用（usage 为供应商返回的 token 用量，可能为空）"""
+        self.calls += 1
+        self.prompt_chars += len(prompt) + len(self.system_prompt)
+        self.total_latency += latency
+        if usage is not None:
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    def parse(self, response_text: str) -> tuple[str, str]:
+        if self.mode == "compact":
+            result = parse_compact_reply(response_text)
+            if result is not None:
+                self.strict_parsed += 1
+                return result
+            self.fallback_parsed += 1
+        return parse_intent_reply(response_text)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "calls": self.calls,
+            "avg_prompt_chars": round(self.prompt_chars / self.calls) if self.calls else 0,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "avg_latency_ms": round(self.total_latency / self.calls * 1000) if self.calls else 0,
+            "strict_parsed": self.strict_parsed,
+            "fallback_parsed": self.fallback_parsed,
+        }
+
+
+class IntentBatchMissError(LookupError):
+    """批量回复中缺少某条消息的结果"""
+
+
+# 批量回复的行格式：“编号. 内容”（兼容 、 : ： ) ） 等分隔符）
+BATCH_LINE_RE = re.compile(r"^\s*(\d+)\s*[.、:：)）]\s*(.+?)\s*$")
+
+
+class IntentBatcher:
+    """
+    LLM 意图识别微批处理
+    在 window 秒内（或攒满 max_items 条）到达的消息合并为一个带编号的提示词，
+    一次 LLM 调用后按编号拆分回复，分别交还给各自的等待方。
+    """
+    def __init__(
+        self,
+        chat,
+        window: float = 0.3,
+        max_items: int = 8,
+        line_example: str = "1. 歌名：xxx；意图：xxx",
+    ):
+        self.chat = chat  # async (prompt: str) -> str
+        self.line_example = line_example
+        self.window = max(0.0, window)
+        self.max_items = max(1, int(max_items))
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        # 统计计数
+        self.batches = 0
+        self.items = 0
+        self.misses = 0
+
+    async def submit(self, text: str) -> str:
+        """提交一条消息，返回该消息对应的回复文本（格式与单条调用一致）"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._pending = self._pending, []
+        if not items:
+            return
+        task = asyncio.create_task(self._run_batch(items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def build_prompt(self, texts: list[str]) -> str:
+        lines = [
+            "以下是多条互相独立的用户输入，请按系统要求逐条分析。",
+            f"每条结果单独一行，行首保留对应编号，例如：{self.line_example}",
+        ]
+        lines += [f"{i}. 用户输入：{text}" for i, text in enumerate(texts, start=1)]
+        return "\n".join(lines)
+
+    @staticmethod
+    def split_reply(reply: str) -> dict[int, str]:
+        """按编号拆分批量回复"""
+        answers = {}
+        for line in reply.splitlines():
+            match = BATCH_LINE_RE.match(line)
+            if match:
+                answers.setdefault(int(match.group(1)), match.group(2))
+        return answers
+
+    async def _run_batch(self, items: list[tuple[str, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(items)
+        try:
+            if len(items) == 1:
+                text, future = items[0]
+                reply = await self.chat(f"用户输入：{text}")
+                if not future.done():
+                    future.set_result(reply)
+                return
+
+            reply = await self.chat(self.build_prompt([text for text, _ in items]))
+            answers = self.split_reply(reply)
+            for i, (_, future) in enumerate(items, start=1):
+                if future.done():
+                    continue
+                if i in answers:
+                    future.set_result(answers[i])
+                else:
+                    self.misses += 1
+                    future.set_exception(IntentBatchMissError(f"批量回复缺少第{i}条"))
+        except asyncio.CancelledError:
+            for _, future in items:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "misses": self.misses,
+        }
+
+    async def close(self):
+        """取消计时器、尚未发出的消息与进行中的批次（等待方随之抛出 CancelledError）"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._pending = self._pending, []
+        for _, future in items:
+            future.cancel()
+        for task in list(self._tasks):
+            task.cancel()
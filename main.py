@@ -1,9 +1,11 @@
 from pathlib import Path
+import os
 import random
-import aiofiles
 import aiohttp
 import traceback
 import asyncio
+import time
+from contextlib import contextmanager, nullcontext
 from astrbot.api.event import filter, AstrMessageEvent
 import astrbot.api.message_components as Comp
 from astrbot.api.star import Context, Star, register
@@ -11,74 +13,121 @@ from astrbot.core.config.astrbot_config import AstrBotConfig
 from astrbot.core.message.components import Record, File
 from astrbot.core.message.message_event_result import MessageChain
 from astrbot import logger
-from data.plugins.astrbot_plugin_music_search.draw import draw_lyrics
+from data.plugins.astrbot_plugin_music_search.draw import (
+    RenderExecutor,
+    RenderQueueFullError,
+    draw_lyrics_async,
+    lyric_render_params,
+)
+from .admission import AdmissionController
+from .api import SingleFlight
+from .cache import AudioCache, CommentPoolCache, LyricImageCache, TTLCache, normalize_key
+from .intent import (
+    INTENT_CODES,
+    IntentBatcher,
+    IntentBatchMissError,
+    IntentReplyParser,
+    RuleIntentClassifier,
+)
+from .download import DownloadError, SegmentedDownloader
+from .metrics import Metrics
+from .net import HealthMonitor, HttpClient
+from .relay import AudioRelay
+from .tracing import Tracer, span
+from .workqueue import QueueFullError, WorkQueue
 
 # 歌曲缓存目录
 SAVED_SONGS_DIR = Path(__file__).parent.resolve() / "songs"
 SAVED_SONGS_DIR.mkdir(parents=True, exist_ok=True)
+# 歌词图片磁盘缓存目录
+LYRIC_CACHE_DIR = Path(__file__).parent.resolve() / "lyric_cache"
+# Prometheus 指标文件默认路径
+METRICS_FILE = Path(__file__).parent.resolve() / "metrics.prom"
+# 慢请求追踪文件默认路径
+TRACE_FILE = Path(__file__).parent.resolve() / "traces.jsonl"
+
+def safe_filename(title: str) -> str:
+    """生成安全文件名（过滤特殊字符，避免路径错误）"""
+    return "".join(
+        c for c in title if c.isalnum() or c in ('_', '-')
+    ).strip().replace(' ', '_') or str(int(random.getrandbits(32)))
+
 
 class FileSenderMixin:
-    """文件发送逻辑的混入类"""
-    async def download_file(self, url: str, title: str) -> Path | None:
+    """文件发送逻辑的混入类（宿主类需提供 http、downloader、audio_cache、_download_flight 与 health_monitor 属性）"""
+    async def download_file(self, url: str, title: str, song_id=None, bitrate="") -> Path | None:
+        """
+        下载音频文件：启用音频缓存时按 (歌曲ID, 码率) 复用已下载的文件，
+        同一歌曲的并发下载只进行一次
+        :return: 下载成功返回文件路径，失败返回None
         """
-        优化版文件下载：含URL验证、网络检测、完整性校验
+        if self.audio_cache is not None and song_id is not None:
+            cached = self.audio_cache.get(song_id, bitrate)
+            if cached:
+                logger.info(f"音频缓存命中: {cached.name}")
+                return cached
+            return await self._download_flight.do(
+                AudioCache.make_name(song_id, bitrate),
+                lambda: self._download_file(url, title, song_id, bitrate),
+            )
+        return await self._download_file(url, title, song_id, bitrate)
+
+    async def _download_file(self, url: str, title: str, song_id=None, bitrate="") -> Path | None:
+        """
+        优化版文件下载：含URL验证、网络检测、分段续传与大小校验；先写临时文件，校验通过后再重命名
         :return: 下载成功返回文件路径，失败返回None
         """
+        temp_path = None
         try:
             # 1. URL有效性验证（仅支持HTTP/HTTPS）
             if not url.startswith(('http://', 'https://')):
                 logger.error(f"无效URL格式: {url}")
                 return None
             
-            # 2. 网络连通性测试（避免容器网络异常）
-            try:
-                async with aiohttp.ClientSession() as test_session:
-                    async with test_session.get("https://www.baidu.com", timeout=5):
-                        pass
-            except Exception as e:
-                logger.error(f"网络连接异常: {str(e)}")
+            # 2. 网络状态检查（读取后台健康监测的缓存结果，不在下载前在线探测）
+            if self.health_monitor.is_down(url):
+                logger.error(f"音频主机不可达（健康监测）: {self.health_monitor.status(url)}")
                 return None
             
-            # 3. 生成安全文件名（过滤特殊字符，避免路径错误）
-            safe_title = "".join(
-                c for c in title if c.isalnum() or c in ('_', '-')
-            ).strip().replace(' ', '_') or str(int(random.getrandbits(32)))
-            filename = f"{safe_title}.mp3"
-            file_path = SAVED_SONGS_DIR / filename
-            logger.debug(f"下载目标路径: {file_path}")
-
-            # 4. 流式下载（修复：删除 stream=True 参数）
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=30) as response:
-                    response.raise_for_status()  # HTTP状态码非200则抛异常
-                    total_size = int(response.headers.get('content-length', 0))
-                    downloaded_size = 0
-
-                    async with aiofiles.open(file_path, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(1024 * 1024):  # 1MB分片
-                            if chunk:
-                                await f.write(chunk)
-                                downloaded_size += len(chunk)
-                                logger.debug(f"已下载: {downloaded_size}/{total_size} 字节")
-
-            # 5. 文件完整性校验（空文件直接删除）
-            if file_path.stat().st_size == 0 or (total_size > 0 and downloaded_size != total_size):
-                logger.error(f"文件下载不完整: 实际大小{file_path.stat().st_size}字节，预期{total_size}字节")
-                file_path.unlink(missing_ok=True)
-                return None
+            # 3. 确定目标路径：有歌曲ID时按 (歌曲ID, 码率) 命名，避免同名歌曲互相覆盖
+            if self.audio_cache is not None and song_id is not None:
+                temp_path = self.audio_cache.temp_path(song_id, bitrate)
+                file_path = None
+            else:
+                filename = (
+                    AudioCache.make_name(song_id, bitrate)
+                    if song_id is not None
+                    else f"{safe_filename(title)}.mp3"
+                )
+                file_path = SAVED_SONGS_DIR / filename
+                temp_path = file_path.with_name(f"{filename}.{random.getrandbits(32):08x}.part")
+            logger.debug(f"下载临时路径: {temp_path}")
 
+            # 4. 分段并行下载（支持 Range 续传，完成后校验文件大小）
+            await self.downloader.download(url, temp_path)
+
+            # 5. 校验通过后原子性重命名（写入缓存时按配额淘汰旧文件）
+            if file_path is None:
+                file_path = self.audio_cache.commit(temp_path, song_id, bitrate)
+            else:
+                os.replace(temp_path, file_path)
             logger.info(f"文件下载完成: {file_path}")
             return file_path
 
         except aiohttp.ClientSSLError as e:
             logger.error(f"SSL证书错误: {str(e)}")
         except asyncio.TimeoutError:  # 已导入asyncio，可正常识别
-            logger.error("文件下载超时（30秒）")
+            logger.error(f"文件下载超时（{self.http.timeouts['download']}秒）")
+        except DownloadError as e:
+            logger.error(f"文件下载失败: {str(e)}")
         except Exception as e:
             logger.error(f"下载异常: {str(e)} | 堆栈: {traceback.format_exc()}")
+        finally:
+            if temp_path is not None:
+                temp_path.unlink(missing_ok=True)
         return None
 
-    async def send_audio_file(self, event: AstrMessageEvent, file_path: Path) -> bool:
+    async def send_audio_file(self, event: AstrMessageEvent, file_path: Path, display_name: str | None = None) -> bool:
         """
         优化版音频文件发送（适配 QQ 平台 aiocqhttp，仅保留 File 组件标准参数）
         :return: 发送成功返回True，失败返回False
@@ -97,7 +146,7 @@ class FileSenderMixin:
             # 3. 构建 File 消息：仅保留标准参数（name + file）
             # 关键修复：删除 file_type 和 size，避免非标准参数报错
             file_msg = File(
-                name=file_path.name,          # 必选：用户端显示的文件名（如 "6000.mp3"）
+                name=display_name or file_path.name,  # 必选：用户端显示的文件名（如 "晴天.mp3"）
                 file=file_abs_path           # 必选：QQ 平台需本地绝对路径字符串
             )
 
@@ -116,6 +165,20 @@ class FileSenderMixin:
                 await event.send(event.plain_result(f"文件发送出错: {str(e)[:20]}..."))
             return False
 
+    async def send_audio_url(self, event: AstrMessageEvent, url: str, display_name: str) -> bool:
+        """
+        以 URL 形式发送音频文件（本地中转模式，由平台自行拉取）
+        :return: 发送成功返回True，失败返回False
+        """
+        try:
+            await event.send(MessageChain(chain=[File(name=display_name, url=url)]))
+            logger.info(f"文件发送成功（中转）: {display_name}")
+            return True
+        except Exception as e:
+            logger.error(f"文件发送失败（中转）: {str(e)} | 地址: {url}")
+            await event.send(event.plain_result(f"文件发送出错: {str(e)[:20]}..."))
+            return False
+
     async def cleanup_file(self, file_path: Path):
         """临时文件清理（参考main (1).txt的finally清理逻辑）"""
         try:
@@ -144,13 +207,99 @@ class MusicPlugin(Star, FileSenderMixin):
         self.enable_lyrics = self.config.get("enable_lyrics", False)
         self.analysis_prob = self.config.get("analysis_prob", 0.9)  # 消息识别概率
 
+        # 渲染执行器（歌词图片等 PIL 绘制不在事件循环中执行）
+        self.render_executor = RenderExecutor(
+            mode=self.config.get("render_executor", "thread"),
+            max_workers=self.config.get("render_workers", 2),
+            max_queue=self.config.get("render_queue_size", 8),
+            timeout=self.config.get("render_timeout", 30),
+        )
+        # 歌词图片缓存（按歌曲ID + 歌词哈希 + 渲染参数）
+        self.lyric_cache = LyricImageCache(
+            max_memory_bytes=int(self.config.get("lyric_cache_memory_mb", 32) * 1024 * 1024),
+            disk_dir=LYRIC_CACHE_DIR,
+            max_disk_bytes=int(self.config.get("lyric_cache_disk_mb", 64) * 1024 * 1024),
+        )
+        self.lyric_params_key = LyricImageCache.params_key(**lyric_render_params())
+        # 歌词文本缓存（歌曲ID → 歌词）：热门歌曲的重复请求跳过歌词拉取，直接按歌词哈希查图片缓存
+        lyric_text_ttl = self.config.get("lyric_text_cache_ttl", 600)
+        self.lyric_text_cache = TTLCache(maxsize=512 if lyric_text_ttl > 0 else 0, ttl=lyric_text_ttl)
+        # 热评池缓存（热评变化很少，本地随机抽取，过期后后台刷新）
+        self.comment_pool = CommentPoolCache(
+            max_comments=self.config.get("comment_pool_max", 5000),
+            ttl=self.config.get("comment_pool_ttl", 86400),
+            max_stale=self.config.get("comment_pool_max_stale", 604800),
+        )
+        self._comment_refreshing: set = set()
+        # 音频文件缓存（按歌曲ID+码率，超出配额按最近使用淘汰；0=不缓存，按原逻辑下载后清理）
+        audio_cache_mb = self.config.get("audio_cache_max_mb", 512)
+        self.audio_cache = (
+            AudioCache(SAVED_SONGS_DIR, int(audio_cache_mb * 1024 * 1024)) if audio_cache_mb > 0 else None
+        )
+        self._download_flight = SingleFlight()
+
+        # 共享HTTP客户端（API请求、文件下载、健康监测共用连接池）
+        self.http = HttpClient(
+            limit=self.config.get("http_pool_limit", 100),
+            limit_per_host=self.config.get("http_pool_limit_per_host", 10),
+            keepalive_timeout=self.config.get("http_keepalive_timeout", 30),
+            dns_cache_ttl=self.config.get("http_dns_cache_ttl", 300),
+            timeouts=self.config.get("http_timeouts", {}),
+            retries=self.config.get("http_retries", 2),
+            retry_base_delay=self.config.get("http_retry_base_delay", 0.3),
+            breaker_threshold=self.config.get("breaker_failure_threshold", 5),
+            breaker_cooldown=self.config.get("breaker_cooldown", 30),
+        )
+        # 音频下载器（支持 Range 的服务器分段并行下载，中断后续传）
+        self.downloader = SegmentedDownloader(
+            self.http,
+            segments=self.config.get("download_segments", 4),
+            retries=self.config.get("download_retries", 3),
+            stall_timeout=self.config.get("download_stall_timeout", 15),
+        )
+        # 本地音频中转（语音/文件发送时平台从本地地址拉取，边下载边转发）
+        self.relay = None
+        if self.config.get("relay_enabled", False):
+            self.relay = AudioRelay(
+                self.http,
+                temp_dir=SAVED_SONGS_DIR,
+                audio_cache=self.audio_cache,
+                host=self.config.get("relay_host", "127.0.0.1"),
+                port=self.config.get("relay_port", 8790),
+                public_base=self.config.get("relay_public_base", ""),
+                stall_timeout=self.config.get("download_stall_timeout", 15),
+            )
+
         # 初始化音乐API
-        if self.default_api == "netease":
-            from .api import NetEaseMusicAPI
-            self.api = NetEaseMusicAPI()
-        elif self.default_api == "netease_nodejs":
-            from .api import NetEaseMusicAPINodeJs
-            self.api = NetEaseMusicAPINodeJs(base_url=self.nodejs_base_url)
+        if self.default_api == "failover":
+            # 组合后端：按优先级对冲请求并自动故障转移
+            from .api import FailoverMusicAPI
+            priority = self.config.get("api_priority", ["netease_nodejs", "netease", "txqq"])
+            self.api = FailoverMusicAPI(
+                {name: self._create_backend(name) for name in priority},
+                default_hedge_delay=self.config.get("hedge_default_delay", 1.0),
+            )
+        else:
+            self.api = self._create_backend(self.default_api)
+
+        # 搜索结果缓存（热门歌曲无需重复请求搜索接口）
+        if self.config.get("search_cache_size", 256) > 0:
+            from .api import CachedSearchAPI
+            self.api = CachedSearchAPI(
+                self.api,
+                maxsize=self.config.get("search_cache_size", 256),
+                ttl=self.config.get("search_cache_ttl", 3600),
+                negative_ttl=self.config.get("search_cache_negative_ttl", 60),
+            )
+
+        # 网络健康监测（后台定期探测API地址与音频主机，热路径只读缓存状态）
+        self.health_monitor = HealthMonitor(
+            interval=self.config.get("health_check_interval", 60),
+            timeout=self.config.get("health_check_timeout", 5),
+            http=self.http,
+        )
+        for url in getattr(self.api, "health_urls", []):
+            self.health_monitor.watch(url, pinned=True)
 
         # LLM意图识别配置（原有核心逻辑保留）
         self.llm_tool_mgr = self.context.get_llm_tool_manager()
@@ -178,49 +327,177 @@ class MusicPlugin(Star, FileSenderMixin):
         """
         # 添加一个配置项，控制是否只在被@时响应
         self.only_respond_when_at = self.config.get("only_respond_when_at", False)
+        # LLM意图识别结果缓存（归一化文本 → (歌名, 意图)，含“无歌名”结果）
+        self.intent_cache = TTLCache(
+            maxsize=self.config.get("intent_cache_size", 512),
+            ttl=self.config.get("intent_cache_ttl", 600),
+        )
+        # 点歌任务队列（限制同时处理的请求数，队列满时礼貌拒绝）
+        self.work_queue = WorkQueue(
+            workers=self.config.get("queue_workers", 4),
+            max_size=self.config.get("queue_max_size", 32),
+        )
+        # 准入控制（按全局/群/用户令牌桶限流，配置为每分钟条数与突发容量）
+        self.admission = AdmissionController({
+            "global": (self.config.get("admission_global_per_minute", 120), self.config.get("admission_global_burst", 20)),
+            "group": (self.config.get("admission_group_per_minute", 20), self.config.get("admission_group_burst", 5)),
+            "user": (self.config.get("admission_user_per_minute", 6), self.config.get("admission_user_burst", 3)),
+        })
+        # 本地规则预分类（明确的非点歌/点歌消息不调用LLM）
+        self.enable_prefilter = self.config.get("enable_prefilter", True)
+        self.prefilter = RuleIntentClassifier(
+            trigger_words=self.config.get("prefilter_trigger_words", []) or None,
+            strict=self.config.get("prefilter_strict", False),
+        )
+        self.prefilter_shadow_prob = self.config.get("prefilter_shadow_prob", 0.05)
+        self._background_tasks: set[asyncio.Task] = set()
+        # 意图识别提示词模式（prose：原有长提示词；compact：精简JSON输出）
+        self.intent_parser = IntentReplyParser(
+            mode=self.config.get("intent_prompt_mode", "prose"),
+            prose_system_prompt=self.llm_system_prompt,
+        )
+        # LLM意图识别微批处理（高峰期将多条消息合并为一次LLM调用）
+        self.intent_batcher = None
+        if self.config.get("intent_batch_enabled", False):
+            self.intent_batcher = IntentBatcher(
+                chat=self._llm_chat,
+                window=self.config.get("intent_batch_window_ms", 300) / 1000,
+                max_items=self.config.get("intent_batch_max", 8),
+                line_example=self.intent_parser.line_example,
+            )
 
-    async def judge_music_intent(self, text: str) -> tuple[str, str]:
-        """原有LLM意图识别逻辑保留"""
-        try:
-            llm_provider = self.context.get_using_provider()
-            if not llm_provider:
-                return "无歌名", "LLM未启用"
-            
+        # 慢请求追踪：记录每条消息各阶段与 HTTP 调用的耗时，超过阈值的写入 JSONL 文件
+        self.tracer = None
+        if self.config.get("trace_enabled", False):
+            self.tracer = Tracer(
+                path=Path(self.config.get("trace_file", "") or TRACE_FILE),
+                slow_threshold=self.config.get("trace_slow_threshold", 5.0),
+                max_bytes=int(self.config.get("trace_file_max_mb", 10) * 1024 * 1024),
+                backups=self.config.get("trace_file_backups", 3),
+                profile_rate=self.config.get("trace_profile_rate", 0.0),
+            )
+
+        # 指标：各阶段耗时直方图 + 各组件统计（缓存命中、队列、限流、熔断等）
+        self.metrics = Metrics()
+        self.metrics_file = Path(self.config.get("metrics_file", "") or METRICS_FILE)
+        self.metrics.add_collector("music_cache", self.intent_cache.stats, cache="intent")
+        self.metrics.add_collector("music_cache", self.lyric_cache.stats, cache="lyric_image")
+        self.metrics.add_collector("music_cache", self.lyric_text_cache.stats, cache="lyric_text")
+        self.metrics.add_collector("music_cache", self.comment_pool.stats, cache="comment_pool")
+        if self.audio_cache is not None:
+            self.metrics.add_collector("music_cache", self.audio_cache.stats, cache="audio")
+        search_backend = getattr(self.api, "backend", self.api)
+        if search_backend is not self.api:  # 搜索结果缓存层
+            self.metrics.add_collector("music_cache", self.api.stats, cache="search")
+        if hasattr(search_backend, "stats"):  # 组合后端的对冲/故障转移统计
+            self.metrics.add_collector("music_failover", search_backend.stats)
+        self.metrics.add_collector("music_prefilter", self.prefilter.stats)
+        self.metrics.add_collector("music_intent_llm", self.intent_parser.stats)
+        if self.intent_batcher is not None:
+            self.metrics.add_collector("music_intent_batch", self.intent_batcher.stats)
+        self.metrics.add_collector("music_admission", self.admission.stats)
+        self.metrics.add_collector("music_queue", self.work_queue.stats)
+        if self.tracer is not None:
+            self.metrics.add_collector("music_trace", self.tracer.stats)
+        self.metrics.add_collector("music_health", self.health_monitor.stats)
+        self.metrics.add_collector("music_breaker", lambda: {"hosts": {
+            host: {**snapshot, "open": snapshot["state"] != "closed"}
+            for host, snapshot in self.http.breaker_snapshot().items()
+        }})
+
+    def _create_backend(self, name: str):
+        """按名称创建单个音乐后端（共用插件的 HTTP 客户端）"""
+        if name == "netease":
+            from .api import NetEaseMusicAPI
+            return NetEaseMusicAPI(http=self.http)
+        if name == "netease_nodejs":
+            from .api import NetEaseMusicAPINodeJs
+            return NetEaseMusicAPINodeJs(base_url=self.nodejs_base_url, http=self.http)
+        if name == "txqq":
+            from .api import MusicSearcher
+            return MusicSearcher(http=self.http)
+        raise ValueError(f"未知的音乐后端: {name}")
+
+    async def _llm_chat(self, prompt: str) -> str:
+        """调用当前LLM完成一次意图识别对话，返回回复文本"""
+        llm_provider = self.context.get_using_provider()
+        start = time.perf_counter()
+        with self._stage("llm_intent"):
             llm_response = await llm_provider.text_chat(
-                prompt=f"用户输入：{text}",
-                system_prompt=self.llm_system_prompt,
+                prompt=prompt,
+                system_prompt=self.intent_parser.system_prompt,
                 image_urls=[],
                 func_tool=self.llm_tool_mgr,
             )
-            response_text = llm_response.completion_text.strip()
-
-            # 解析LLM结果
-            song_name = "无歌名"
-            intent = "无"
-            if "歌名：" in response_text:
-                # 提取歌名部分，排除意图部分
-                song_part = response_text.split("歌名：")[-1].split("；")[0].strip()
-                # 如果歌名中包含了意图字段，需要进一步处理
-                if "意图：" in song_part:
-                    song_name = song_part.split("意图：")[0].strip()
-                else:
-                    song_name = song_part
-                    
-            if "意图：" in response_text:
-                intent = response_text.split("意图：")[-1].strip()
-            
+        self.intent_parser.record_call(
+            prompt,
+            time.perf_counter() - start,
+            usage=getattr(getattr(llm_response, "raw_completion", None), "usage", None),
+        )
+        return llm_response.completion_text.strip()
+
+    async def judge_music_intent(self, text: str) -> tuple[str, str]:
+        """LLM意图识别（相同文本在有效期内直接复用缓存结果，可选微批合并请求）"""
+        cache_key = normalize_key(text)
+        cached = self.intent_cache.get(cache_key)
+        if cached is not None:
+            logger.debug(f"意图缓存命中: {text[:30]} | 已节省LLM调用 {self.intent_cache.hits} 次")
+            return cached
+        try:
+            if not self.context.get_using_provider():
+                return "无歌名", "LLM未启用"
+
+            if self.intent_batcher:
+                try:
+                    response_text = await self.intent_batcher.submit(text)
+                except IntentBatchMissError:
+                    # 批量回复中缺少该条结果，单独重试一次
+                    response_text = await self._llm_chat(f"用户输入：{text}")
+            else:
+                response_text = await self._llm_chat(f"用户输入：{text}")
+
+            song_name, intent = self.intent_parser.parse(response_text)
+            # 仅缓存成功识别的结果（包括“无歌名”），LLM异常不缓存
+            self.intent_cache.set(cache_key, (song_name, intent))
             return song_name, intent
         except Exception as e:
             logger.error(f"LLM识别失败: {str(e)}")
             return "无歌名", "识别失败"
 
-@filter.event_message_type(filter.EventMessageType.ALL)
-async def on_all_message(self, event: AstrMessageEvent):
-    """主消息监听逻辑：融合AI识别与优化版文件发送"""
-    # 检查是否只在被@时响应
-    if self.only_respond_when_at:
-        # 检查消息链中是否包含@机器人的组件
-        at_me = False
+    def _spawn(self, coro) -> asyncio.Task:
+        """创建后台任务并持有引用（避免任务被提前回收）"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    @contextmanager
+    def _stage(self, name: str, **labels):
+        """阶段计时：with self._stage("search", backend=...) as stage，可设置 stage.outcome（同时记录追踪片段）"""
+        with span(name, **labels) as trace_attrs, self.metrics.stage(name, **labels) as stage:
+            yield stage
+            if trace_attrs is not None and stage.outcome:
+                trace_attrs["outcome"] = stage.outcome
+
+    def _trace(self, event: AstrMessageEvent, text: str):
+        """为一条消息开启慢请求追踪（未启用时为空上下文）"""
+        if self.tracer is None:
+            return nullcontext()
+        return self.tracer.trace(
+            group_id=event.get_group_id(),
+            user_id=event.get_sender_id(),
+            text=text[:50],
+        )
+
+    async def _shadow_check(self, text: str, local_result: tuple[str, str]):
+        """抽样复核：用LLM结果校验本地预分类结论，用于统计预分类准确率"""
+        song_name, intent = await self.judge_music_intent(text)
+        if intent in ("LLM未启用", "识别失败"):
+            return
+        self.prefilter.record_shadow(local_result, (song_name, intent))
+
+    def _mentions_me(self, event: AstrMessageEvent) -> bool | None:
+        """消息链中是否包含@机器人的组件（无法获取机器人自身ID时返回None）"""
         # 获取机器人自身ID
         try:
             self_id = str(event.get_self_id())
@@ -233,36 +510,85 @@ async def on_all_message(self, event: AstrMessageEvent):
                 self_id = str(event.bot.self_id)
 
         if not self_id:
-            # 如果无法获取self_id，记录错误并默认响应所有消息
-            logger.warning("无法获取机器人自身ID，将响应所有消息")
-        else:
-            for component in event.message_obj.message:
-                # 检查组件是否有qq属性（@消息）
-                if hasattr(component, 'qq') and str(component.qq) == self_id:
-                    at_me = True
-                    break
-                # 检查组件是否有user_id属性（某些平台可能用user_id表示@）
-                elif hasattr(component, 'user_id') and str(component.user_id) == self_id:
-                    at_me = True
-                    break
-                # 检查组件是否有at属性（通用at组件）
-                elif hasattr(component, 'at') and str(component.at) == self_id:
-                    at_me = True
-                    break
-
-            if not at_me:
-                return
+            if self.only_respond_when_at:
+                # 如果无法获取self_id，记录错误并默认响应所有消息
+                logger.warning("无法获取机器人自身ID，将响应所有消息")
+            return None
+        for component in event.message_obj.message:
+            # 检查组件是否有qq属性（@消息）
+            if hasattr(component, 'qq') and str(component.qq) == self_id:
+                return True
+            # 检查组件是否有user_id属性（某些平台可能用user_id表示@）
+            elif hasattr(component, 'user_id') and str(component.user_id) == self_id:
+                return True
+            # 检查组件是否有at属性（通用at组件）
+            elif hasattr(component, 'at') and str(component.at) == self_id:
+                return True
+        return False
 
-        # 概率触发（避免频繁调用LLM）
-        if random.random() > self.analysis_prob:
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("music_stats")
+    async def music_stats(self, event: AstrMessageEvent):
+        """查看点歌插件各阶段耗时、缓存命中与队列/限流统计（仅管理员）"""
+        yield event.plain_result(self.metrics.summary())
+
+    @filter.event_message_type(filter.EventMessageType.ALL)
+    async def on_all_message(self, event: AstrMessageEvent):
+        """主消息监听逻辑：融合AI识别与优化版文件发送"""
+        at_me = self._mentions_me(event)
+        # 检查是否只在被@时响应（无法获取机器人ID时响应所有消息）
+        if self.only_respond_when_at and at_me is False:
             return
-        
+
+        self.health_monitor.start()
+        self.metrics.start_exporter(self.metrics_file, self.config.get("metrics_export_interval", 60))
         text = event.get_message_str().strip()
         if not text:
             return
-        
-        # 1. LLM识别歌名与意图
-        song_name, intent = await self.judge_music_intent(text)
+
+        # 1. 识别歌名与意图：本地规则能确定的直接使用，其余交给LLM
+        local_result = self.prefilter.classify(text) if self.enable_prefilter else None
+        # 抽样复核同样会调用LLM，只在通过准入控制（消耗令牌）后发起
+        shadow = local_result is not None and random.random() < self.prefilter_shadow_prob
+        if local_result is not None and local_result[1] == "无":
+            self.metrics.inc("music_messages_total", result="prefilter_skip")
+            if shadow and not self.admission.admit(group_id=event.get_group_id(), user_id=event.get_sender_id()):
+                self._spawn(self._shadow_check(text, local_result))
+            return
+        # 概率触发（避免频繁调用LLM）
+        if local_result is None and random.random() > self.analysis_prob:
+            self.metrics.inc("music_messages_total", result="sampled_out")
+            return
+        # 准入控制：LLM 识别与接口请求之前按全局/群/用户令牌桶限流，超出时直接忽略
+        if self.admission.admit(group_id=event.get_group_id(), user_id=event.get_sender_id()):
+            self.metrics.inc("music_messages_total", result="admission_rejected")
+            return
+        if shadow:
+            self._spawn(self._shadow_check(text, local_result))
+        # 放入有界任务队列，由固定数量的工作协程处理（@机器人的消息优先）
+        with self._trace(event, text):
+            try:
+                with self._stage("total") as stage:
+                    try:
+                        await self.work_queue.submit(
+                            lambda: self._process_message(event, text, local_result),
+                            priority=0 if at_me else 1,
+                        )
+                    except QueueFullError:
+                        stage.outcome = "rejected"
+                        self.metrics.inc("music_messages_total", result="queue_full")
+                        raise
+                    self.metrics.inc("music_messages_total", result="processed")
+            except QueueFullError:
+                await event.send(event.plain_result("点歌的人太多啦，请稍后再试~"))
+
+    async def _process_message(self, event: AstrMessageEvent, text: str, local_result: tuple[str, str] | None):
+        """点歌处理流水线：意图识别 → 搜索 → 获取音频 → 按意图发送 → 热评/歌词"""
+        if local_result is not None:
+            song_name, intent = local_result
+        else:
+            with span("intent"):
+                song_name, intent = await self.judge_music_intent(text)
         # 修复：更严格的判断条件，防止发送"无歌名"相关消息
         if song_name == "无歌名" or intent == "无" or "无歌名" in song_name or "无" == intent:
             return
@@ -274,7 +600,10 @@ async def on_all_message(self, event: AstrMessageEvent):
             return
         
         # 2. 搜索歌曲信息
-        songs = await self.api.fetch_data(keyword=song_name, limit=1)
+        with self._stage("search", backend=self.default_api) as stage:
+            songs = await self.api.fetch_data(keyword=song_name, limit=1)
+            if not songs:
+                stage.outcome = "empty"
         if not songs:
             await event.send(event.plain_result(f"未找到歌曲《{song_name}》~"))
             return
@@ -282,80 +611,187 @@ async def on_all_message(self, event: AstrMessageEvent):
         song_id = selected_song["id"]
         file_path = None  # 初始化临时文件路径
 
+        # 歌曲ID确定后立即启动只依赖歌曲ID的阶段（热评、歌词），
+        # 与音频链接获取及卡片/文件发送并行执行，发送时仍保持原有顺序
+        side_stages: dict[str, asyncio.Task] = {}
+        if self.enable_comments:
+            side_stages["comment"] = asyncio.create_task(self._fetch_hot_comment(song_id))
+        if self.enable_lyrics:
+            side_stages["lyrics"] = asyncio.create_task(self._fetch_lyric_image(song_id, song_name))
+
         try:
             # 3. 获取歌曲音频链接（新增日志）
-            extra_info = await self.api.fetch_extra(song_id=song_id)
-            audio_url = extra_info.get("audio_url", "")
+            with self._stage("audio_url", backend=self.default_api) as stage:
+                extra_info = await self.api.fetch_extra(song_id=song_id)
+                audio_url = extra_info.get("audio_url", "")
+                if not audio_url:
+                    stage.outcome = "empty"
             logger.debug(f"获取音频链接结果 | song_id: {song_id} | extra_info: {extra_info} | audio_url: {audio_url}")  # 新增日志
-            if not audio_url:
+            if audio_url:
+                self.health_monitor.watch(audio_url)
+            else:
                 # 新增：提示用户检查 API 状态
                 await event.send(event.plain_result(f"获取《{song_name}》音频链接失败~ 可能原因：API 接口不可用/歌曲无权限"))
                 return
 
             platform_name = event.get_platform_name()
             # 4. 按意图执行操作（核心变更：文件发送逻辑替换为优化版）
-            # 4.1 发卡片（仅QQ个人号）
-            if intent in ["默认", "发卡片"] and platform_name == "aiocqhttp":
-                from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import AiocqhttpMessageEvent
-                assert isinstance(event, AiocqhttpMessageEvent)
-                client = event.bot
-                is_private = event.is_private_chat()
-                payloads = {
-                    "message": [{"type": "music", "data": {"type": "163", "id": str(song_id)}}]
-                }
-                if is_private:
-                    payloads["user_id"] = event.get_sender_id()
-                    await client.api.call_action("send_private_msg", **payloads)
-                else:
-                    payloads["group_id"] = event.get_group_id()
-                    await client.api.call_action("send_group_msg", **payloads)
-                await event.send(event.plain_result(f"已发送《{song_name}》音乐卡片~"))
-
-            # 4.2 发链接
-            elif intent == "发链接":
-                song_info = f"🎶《{selected_song['name']}》- {selected_song['artists']}\n🔗播放链接：{audio_url}"
-                await event.send(event.plain_result(song_info))
-
-            # 4.3 发语音（原逻辑保留，适配多平台）
-            elif intent == "发语音" and platform_name in ["aiocqhttp", "telegram", "lark"]:
-                await event.send(event.chain_result([Record.fromURL(audio_url)]))
-                await event.send(event.plain_result(f"已发送《{song_name}》语音~"))
-
-            # 4.4 发文件（核心优化：使用融合后的下载+发送逻辑）
-            elif intent == "发文件":
-                await event.send(event.plain_result(f"开始下载《{song_name}》，请稍候..."))
-                # 调用优化版下载方法
-                file_path = await self.download_file(audio_url, song_name)
-                if not file_path:
-                    await event.send(event.plain_result(f"《{song_name}》下载失败，无法发送文件~"))
-                    return
-                # 调用优化版发送方法
-                send_success = await self.send_audio_file(event, file_path)
-                if send_success:
-                    await event.send(event.plain_result(f"已发送《{song_name}》音频文件~"))
-
-            # 5. 发送热评（原有逻辑保留）
-            if self.enable_comments:
-                comments = await self.api.fetch_comments(song_id=song_id)
-                if comments:
-                    hot_comment = random.choice(comments)["content"]
-                    await event.send(event.plain_result(f"🔥热评：{hot_comment}"))
+            # 4.x 各分支整体计为 send 阶段（发文件时包含下载，下载另有 download 阶段）
+            # intent 取自 LLM 回复，可能是任意文本：未知意图统一记为 other，避免指标标签无限增长
+            intent_label = intent if intent in INTENT_CODES.values() else "other"
+            with self._stage("send", intent=intent_label) as send_stage:
+                # 4.1 发卡片（仅QQ个人号）
+                if intent in ["默认", "发卡片"] and platform_name == "aiocqhttp":
+                    from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import AiocqhttpMessageEvent
+                    assert isinstance(event, AiocqhttpMessageEvent)
+                    client = event.bot
+                    is_private = event.is_private_chat()
+                    payloads = {
+                        "message": [{"type": "music", "data": {"type": "163", "id": str(song_id)}}]
+                    }
+                    if is_private:
+                        payloads["user_id"] = event.get_sender_id()
+                        await client.api.call_action("send_private_msg", **payloads)
+                    else:
+                        payloads["group_id"] = event.get_group_id()
+                        await client.api.call_action("send_group_msg", **payloads)
+                    await event.send(event.plain_result(f"已发送《{song_name}》音乐卡片~"))
+
+                # 4.2 发链接
+                elif intent == "发链接":
+                    song_info = f"🎶《{selected_song['name']}》- {selected_song['artists']}\n🔗播放链接：{audio_url}"
+                    await event.send(event.plain_result(song_info))
+
+                # 4.3 发语音（原逻辑保留，适配多平台）
+                elif intent == "发语音" and platform_name in ["aiocqhttp", "telegram", "lark"]:
+                    record_url = audio_url
+                    if self.relay is not None:
+                        record_url = await self.relay.url_for(audio_url, song_id, extra_info.get("bitrate", ""))
+                    await event.send(event.chain_result([Record.fromURL(record_url)]))
+                    await event.send(event.plain_result(f"已发送《{song_name}》语音~"))
 
-            # 6. 发送歌词（原有逻辑保留）
-            if self.enable_lyrics:
-                lyrics = await self.api.fetch_lyrics(song_id=song_id)
-                if lyrics != "歌词未找到":
-                    lyric_image = draw_lyrics(lyrics)
-                    await event.send(MessageChain(chain=[Comp.Image.fromBytes(lyric_image)]))
+                # 4.4 发文件（核心优化：使用融合后的下载+发送逻辑）
+                elif intent == "发文件" and self.relay is not None:
+                    # 中转模式：平台边下载边接收，无需等待文件完整落盘
+                    relay_url = await self.relay.url_for(audio_url, song_id, extra_info.get("bitrate", ""))
+                    send_success = await self.send_audio_url(
+                        event, relay_url, display_name=f"{safe_filename(song_name)}.mp3"
+                    )
+                    if send_success:
+                        await event.send(event.plain_result(f"已发送《{song_name}》音频文件~"))
+                    else:
+                        send_stage.outcome = "failed"
+                elif intent == "发文件":
+                    await event.send(event.plain_result(f"开始下载《{song_name}》，请稍候..."))
+                    bitrate = extra_info.get("bitrate", "")
+                    # 下载到发送完成前占用缓存文件，避免被其他请求触发的缓存淘汰删除
+                    lease = (
+                        self.audio_cache.lease(song_id, bitrate)
+                        if self.audio_cache is not None and song_id is not None
+                        else nullcontext()
+                    )
+                    with lease:
+                        # 调用优化版下载方法
+                        with self._stage("download") as stage:
+                            file_path = await self.download_file(
+                                audio_url, song_name, song_id=song_id, bitrate=bitrate
+                            )
+                            if not file_path:
+                                stage.outcome = "failed"
+                        if not file_path:
+                            send_stage.outcome = "failed"
+                            await event.send(event.plain_result(f"《{song_name}》下载失败，无法发送文件~"))
+                            return
+                        # 调用优化版发送方法
+                        send_success = await self.send_audio_file(
+                            event, file_path, display_name=f"{safe_filename(song_name)}.mp3"
+                        )
+                    if send_success:
+                        await event.send(event.plain_result(f"已发送《{song_name}》音频文件~"))
+                    else:
+                        send_stage.outcome = "failed"
+
+            # 5. 发送热评（已在后台并发获取，此处按原顺序发送）
+            if "comment" in side_stages:
+                with span("send_comment"):
+                    hot_comment = await side_stages["comment"]
+                    if hot_comment:
+                        await event.send(event.plain_result(f"🔥热评：{hot_comment}"))
+
+            # 6. 发送歌词图片（同上）
+            if "lyrics" in side_stages:
+                with span("send_lyrics"):
+                    lyric_image = await side_stages["lyrics"]
+                    if lyric_image:
+                        await event.send(MessageChain(chain=[Comp.Image.fromBytes(lyric_image)]))
 
         except Exception as e:
             logger.error(f"处理《{song_name}》出错: {traceback.format_exc()}")
             await event.send(event.plain_result(f"处理《{song_name}》时出错，请联系管理员~"))
         finally:
-            # 7. 临时文件清理
-            if self.auto_cleanup and file_path and isinstance(file_path, Path):
+            # 提前结束（如音频链接获取失败）时取消仍在进行的并行阶段
+            for task in side_stages.values():
+                task.cancel()
+            # 7. 临时文件清理（启用音频缓存时文件由缓存按配额管理，不再删除）
+            if self.auto_cleanup and self.audio_cache is None and file_path and isinstance(file_path, Path):
                 await self.cleanup_file(file_path)
 
+    async def _fetch_hot_comment(self, song_id) -> str | None:
+        """获取一条随机热评：优先从评论池缓存抽取，过期的评论池在后台刷新（失败返回None）"""
+        pool, stale = self.comment_pool.get(song_id)
+        if pool is not None:
+            if stale and song_id not in self._comment_refreshing:
+                self._comment_refreshing.add(song_id)
+                self._spawn(self._load_comments(song_id)).add_done_callback(
+                    lambda _task: self._comment_refreshing.discard(song_id)
+                )
+            return random.choice(pool)
+        pool = await self._load_comments(song_id)
+        return random.choice(pool) if pool else None
+
+    async def _load_comments(self, song_id) -> list[str]:
+        """拉取热评并写入评论池缓存（失败返回空列表，不缓存）"""
+        try:
+            with self._stage("comments", backend=self.default_api) as stage:
+                comments = await self.api.fetch_comments(song_id=song_id)
+                if not comments:
+                    stage.outcome = "empty"
+            pool = [c["content"] for c in comments if c.get("content")]
+            self.comment_pool.put(song_id, pool)
+            return pool
+        except Exception as e:
+            logger.error(f"获取热评失败 | song_id: {song_id} | 错误: {str(e)}")
+            return []
+
+    async def _fetch_lyric_image(self, song_id, song_name: str) -> bytes | None:
+        """获取歌词图片：取得歌词（短期缓存，未命中再拉取）后按歌词内容查缓存，未命中再渲染（失败返回None）"""
+        try:
+            lyrics = self.lyric_text_cache.get(song_id)
+            if lyrics is None:
+                with self._stage("lyric_fetch", backend=self.default_api) as stage:
+                    lyrics = await self.api.fetch_lyrics(song_id=song_id)
+                    if lyrics in ("歌词未找到", "歌词获取失败"):
+                        stage.outcome = "empty"
+                        return None
+                self.lyric_text_cache.set(song_id, lyrics)
+            # 缓存键包含歌词哈希，上游歌词更新后会重新渲染
+            with span("lyric_cache_get") as trace_attrs:
+                lyric_image = await self.lyric_cache.get(song_id, self.lyric_params_key, lyrics)
+                if trace_attrs is not None:
+                    trace_attrs["hit"] = lyric_image is not None
+            if lyric_image is not None:
+                return lyric_image
+            with self._stage("render"):
+                lyric_image = await draw_lyrics_async(lyrics, executor=self.render_executor)
+            with span("lyric_cache_put"):
+                await self.lyric_cache.put(song_id, self.lyric_params_key, lyrics, lyric_image)
+            return lyric_image
+        except (RenderQueueFullError, asyncio.TimeoutError) as e:
+            logger.warning(f"歌词图片渲染跳过《{song_name}》: {str(e) or '渲染超时'}")
+        except Exception as e:
+            logger.error(f"获取歌词图片失败《{song_name}》: {str(e)}")
+        return None
+
     @staticmethod
     def format_time(duration_ms):
         """原有时长格式化逻辑保留"""
@@ -369,6 +805,20 @@ async def on_all_message(self, event: AstrMessageEvent):
             return f"{minutes:02d}:{seconds:02d}"
 
     async def terminate(self):
-        """插件卸载时关闭API会话"""
+        """插件卸载时取消后台任务、工作协程与意图批处理，关闭API会话、健康监测、音频中转、共享HTTP客户端与渲染执行器"""
+        for task in list(self._background_tasks):
+            task.cancel()
+        await self.work_queue.close()
+        if self.intent_batcher is not None:
+            await self.intent_batcher.close()
+        await self.metrics.close()
         await self.api.close()
+        tripped = {k: v for k, v in self.http.breaker_snapshot().items() if v["open_count"]}
+        if tripped:
+            logger.info(f"熔断器统计: {tripped}")
+        await self.health_monitor.close()
+        if self.relay is not None:
+            await self.relay.close()
+        await self.http.close()
+        self.render_executor.shutdown()
         await super().terminate()
@@ -0,0 +1,230 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from astrbot.api import logger
+
+# 耗时直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """累积直方图（Prometheus 语义：每个桶统计 <= 上界的样本数）"""
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估算分位数（落在 +Inf 桶时返回最大上界）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+
+class _Stage:
+    """阶段计时上下文：退出时按 outcome 记录耗时；未显式设置时正常结束为 ok，抛出异常为 error"""
+    __slots__ = ("metrics", "name", "labels", "outcome", "started")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.outcome = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            outcome = "cancelled" if issubclass(exc_type, asyncio.CancelledError) else "error"
+        else:
+            outcome = self.outcome or "ok"
+        self.metrics.observe(
+            "music_stage_seconds",
+            time.perf_counter() - self.started,
+            stage=self.name,
+            outcome=outcome,
+            **self.labels,
+        )
+        return False
+
+
+def _flatten(stats: dict, labels: dict):
+    """将组件 stats() 的数值字段展开为 (字段名, 标签, 值)；嵌套一层的字典以 key 标签区分"""
+    for field, value in stats.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            yield field, labels, value
+        elif isinstance(value, dict):
+            for key, inner in value.items():
+                if isinstance(inner, (int, float)) and not isinstance(inner, bool):
+                    yield field, {**labels, "key": key}, inner
+                elif isinstance(inner, dict):
+                    for inner_field, inner_value in inner.items():
+                        if isinstance(inner_value, bool):
+                            inner_value = int(inner_value)
+                        if isinstance(inner_value, (int, float)):
+                            yield inner_field, {**labels, "key": key}, inner_value
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in sorted(labels.items()):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Metrics:
+    """
+    插件指标注册表：阶段耗时直方图、计数器，以及从各组件 stats() 采集的状态值
+    - stage(name, **labels)：with 语句包裹一个阶段，按 stage/outcome/自定义标签记录耗时
+    - add_collector(prefix, fn, **labels)：导出时调用 fn() 获取组件统计（缓存命中、队列深度等）
+    - 导出为 Prometheus 文本格式，或生成聊天命令使用的摘要
+    """
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms: dict[tuple, Histogram] = {}
+        self._counters: dict[tuple, float] = {}
+        self._collectors: list[tuple[str, callable, dict]] = []
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def stage(self, name: str, **labels) -> _Stage:
+        return _Stage(self, name, labels)
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_collector(self, prefix: str, fn, **labels):
+        self._collectors.append((prefix, fn, labels))
+
+    def _collect(self):
+        for prefix, fn, labels in self._collectors:
+            try:
+                stats = fn()
+            except Exception as e:
+                logger.debug(f"指标采集失败 | {prefix}: {str(e)}")
+                continue
+            for field, field_labels, value in _flatten(stats or {}, labels):
+                yield f"{prefix}_{field}", field_labels, value
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式：同名指标（如多个组件的 music_cache_*）合并为一个连续的块，只输出一次 TYPE"""
+        families: dict[str, tuple[str, list[str]]] = {}
+
+        def family(name: str, kind: str) -> list[str]:
+            if name not in families:
+                families[name] = (kind, [])
+            return families[name][1]
+
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            samples = family(name, "histogram")
+            labels = dict(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.counts):
+                cumulative += count
+                samples.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+            samples.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+            samples.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+            samples.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        for (name, labels), value in sorted(self._counters.items()):
+            family(name, "counter").append(f"{name}{_format_labels(dict(labels))} {value}")
+        for name, labels, value in self._collect():
+            family(name, "gauge").append(f"{name}{_format_labels(labels)} {value}")
+        lines = []
+        for name, (kind, samples) in families.items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """聊天命令使用的简要统计：各阶段次数与耗时分位数、计数器，以及各组件状态"""
+        stages: dict[str, list] = {}
+        for (name, labels), histogram in self._histograms.items():
+            if name != "music_stage_seconds":
+                continue
+            labels = dict(labels)
+            stages.setdefault(labels["stage"], []).append((labels, histogram))
+        lines = ["📊 点歌插件统计"]
+        for stage, items in sorted(stages.items()):
+            merged = Histogram(self.buckets)
+            outcomes: dict[str, int] = {}
+            for labels, histogram in items:
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.sum += histogram.sum
+                merged.count += histogram.count
+                outcomes[labels["outcome"]] = outcomes.get(labels["outcome"], 0) + histogram.count
+            outcome_text = " ".join(f"{k}:{v}" for k, v in sorted(outcomes.items()))
+            lines.append(
+                f"{stage}: {merged.count}次 | 平均 {merged.sum / merged.count:.2f}s"
+                f" | p50≤{merged.quantile(0.5)}s p90≤{merged.quantile(0.9)}s | {outcome_text}"
+            )
+        for (name, labels), value in sorted(self._counters.items()):
+            lines.append(f"{name}{''.join(f'[{v}]' for _, v in labels)}: {value:g}")
+        for prefix, fn, labels in self._collectors:
+            try:
+                stats = fn()
+            except Exception:
+                continue
+            if stats:
+                label_text = "".join(f"[{v}]" for v in labels.values())
+                fields = " ".join(f"{k}={v}" for k, v in stats.items() if isinstance(v, (int, float)))
+                if fields:
+                    lines.append(f"{prefix}{label_text}: {fields}")
+        return "\n".join(lines)
+
+    def write_file(self, path: Path):
+        """写入 Prometheus 文本文件（先写临时文件再替换，供 node_exporter textfile 采集）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.tmp")
+        temp_path.write_text(self.render_prometheus(), encoding="utf-8")
+        os.replace(temp_path, path)
+
+    def start_exporter(self, path: Path, interval: float):
+        """定期写出指标文件（interval<=0 时不启动；可重复调用，需在事件循环中调用）"""
+        if interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._export_loop(Path(path), interval))
+
+    async def _export_loop(self, path: Path, interval: float):
+        while True:
+            try:
+                self.write_file(path)
+            except Exception as e:
+                logger.error(f"指标文件写出失败: {str(e)}")
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
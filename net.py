@@ -0,0 +1,335 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import aiohttp
+from astrbot.api import logger
+
+from .tracing import span
+
+
+def url_origin(url: str) -> str:
+    """提取 URL 的 scheme://host[:port] 部分"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}" if parts.scheme and parts.netloc else ""
+
+
+# 各类操作的默认超时（秒）
+DEFAULT_TIMEOUTS = {
+    "search": 10,
+    "lyrics": 10,
+    "comments": 10,
+    "audio_url": 10,
+    "download": 180,
+    "image": 15,
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于打开状态，请求被快速拒绝"""
+
+
+class RetryableStatusError(aiohttp.ClientResponseError):
+    """可重试的 HTTP 状态码（5xx / 429）"""
+
+
+class CircuitBreaker:
+    """
+    单个主机的熔断器
+    closed（正常）→ 连续失败达到 failure_threshold 次 → open（快速失败）
+    → 冷却 cooldown 秒后 half_open（只放行一个探测请求）→ 成功则 closed，失败重新 open
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 30):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        # 统计计数
+        self.rejected = 0
+        self.open_count = 0
+
+    def allow(self) -> bool:
+        """是否放行本次请求"""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            self._probing = False
+            logger.info(f"熔断器半开，放行探测请求 | 主机: {self.name}")
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"熔断器关闭，主机恢复 | 主机: {self.name}")
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def release(self):
+        """请求未得出结论（被取消、出现非网络异常）时释放半开状态下的探测名额"""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or (
+            self.state == "closed" and self.failures >= self.failure_threshold
+        ):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probing = False
+            self.open_count += 1
+            logger.warning(
+                f"熔断器打开 | 主机: {self.name} | 连续失败: {self.failures} | 冷却: {self.cooldown}秒"
+            )
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "open_count": self.open_count,
+        }
+
+
+class HttpClient:
+    """
+    插件共享的 HTTP 客户端：所有 API 后端、文件下载、图片下载与健康监测共用一个连接池
+    - limit / limit_per_host: 连接池总连接数与单主机连接数上限
+    - keepalive_timeout: 空闲连接保持时间（秒），复用 TCP/TLS 连接
+    - dns_cache_ttl: DNS 解析缓存时间（秒）
+    - timeouts: 按操作类型的超时配置（search/lyrics/comments/audio_url/download/image）
+    - retries / retry_base_delay: 幂等请求的最大重试次数与退避基准（秒）
+    - breaker_threshold / breaker_cooldown: 单主机熔断的连续失败阈值与冷却时间（秒）
+    """
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 10,
+        keepalive_timeout: float = 30,
+        dns_cache_ttl: int = 300,
+        timeouts: dict | None = None,
+        retries: int = 2,
+        retry_base_delay: float = 0.3,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 30,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.retries = max(0, int(retries))
+        self.retry_base_delay = retry_base_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """共享会话（首次使用时在事件循环内创建）"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def timeout(self, op: str) -> aiohttp.ClientTimeout:
+        """获取指定操作的超时设置"""
+        return aiohttp.ClientTimeout(total=self.timeouts.get(op, DEFAULT_TIMEOUTS["search"]))
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """获取 URL 所在主机的熔断器"""
+        origin = url_origin(url)
+        if origin not in self.breakers:
+            self.breakers[origin] = CircuitBreaker(
+                origin, failure_threshold=self.breaker_threshold, cooldown=self.breaker_cooldown
+            )
+        return self.breakers[origin]
+
+    async def request_text(
+        self, method: str, url: str, op: str = "search", idempotent: bool = True, **kwargs
+    ) -> tuple[int, str, str]:
+        """
+        发送请求并读取响应文本，带熔断与重试：
+        - 主机熔断打开时直接抛出 CircuitOpenError，不发起请求
+        - 网络错误、超时、5xx/429 计为失败；幂等请求按指数退避（带随机抖动）重试
+        - 一次调用（含全部重试）只向熔断器记录一次结果；未得出结论时释放探测名额
+        :return: (状态码, 响应文本, Content-Type)
+        """
+        breaker = self.breaker(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"主机熔断中: {breaker.name}")
+        attempts = self.retries + 1 if idempotent else 1
+        settled = False
+        try:
+            for attempt in range(attempts):
+                try:
+                    with span("http", method=method, url=url, op=op, attempt=attempt + 1) as trace_attrs:
+                        async with self.session.request(
+                            method, url, timeout=self.timeout(op), **kwargs
+                        ) as response:
+                            body = await response.read()
+                            text = await response.text()
+                            if trace_attrs is not None:
+                                trace_attrs.update(status=response.status, bytes=len(body))
+                            if response.status >= 500 or response.status == 429:
+                                raise RetryableStatusError(
+                                    response.request_info, response.history,
+                                    status=response.status, message=text[:200],
+                                )
+                            breaker.record_success()
+                            settled = True
+                            return response.status, text, response.headers.get("Content-Type", "")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt + 1 >= attempts:
+                        breaker.record_failure()
+                        settled = True
+                        raise
+                    delay = self.retry_base_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+                    logger.debug(
+                        f"请求失败，{delay:.2f}秒后重试（{attempt + 1}/{attempts - 1}）| URL: {url} | 错误: {str(e) or type(e).__name__}"
+                    )
+                    await asyncio.sleep(delay)
+        finally:
+            if not settled:
+                # 被取消或出现非网络异常（如响应解码失败）：不计成败，但不能一直占用探测名额
+                breaker.release()
+
+    def breaker_snapshot(self) -> dict[str, dict]:
+        return {name: breaker.snapshot() for name, breaker in self.breakers.items()}
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("共享 HTTP 客户端已关闭")
+
+
+class HealthMonitor:
+    """
+    后台网络健康监测：定期探测 API 地址与音频 CDN 主机，缓存可用状态与延迟。
+    请求热路径只读取缓存的状态，不再在每次下载前在线探测。
+    - interval: 探测间隔（秒），<=0 时不启动后台任务
+    - fail_threshold: 连续失败多少次才判定为不可用（避免偶发抖动误判）
+    - max_hosts: 监测的主机数上限（音频 CDN 主机按最近使用保留）
+    """
+    def __init__(
+        self,
+        interval: float = 60,
+        timeout: float = 5,
+        fail_threshold: int = 2,
+        max_hosts: int = 32,
+        http: HttpClient | None = None,
+    ):
+        self.interval = interval
+        self.timeout = timeout
+        self.http = http or HttpClient()
+        self._owns_http = http is None
+        self.fail_threshold = max(1, int(fail_threshold))
+        self.max_hosts = max_hosts
+        self._targets: OrderedDict[str, bool] = OrderedDict()  # origin -> 是否常驻（API 地址不淘汰）
+        self._status: dict[str, dict] = {}
+        self._task: asyncio.Task | None = None
+
+    def watch(self, url: str, pinned: bool = False):
+        """登记需要监测的地址（按主机去重）"""
+        origin = url_origin(url)
+        if not origin:
+            return
+        if origin in self._targets:
+            self._targets.move_to_end(origin)
+            self._targets[origin] = self._targets[origin] or pinned
+            return
+        self._targets[origin] = pinned
+        while len(self._targets) > self.max_hosts:
+            victim = next((o for o, p in self._targets.items() if not p), None)
+            if victim is None:
+                break
+            del self._targets[victim]
+            self._status.pop(victim, None)
+
+    def start(self):
+        """启动后台探测任务（可重复调用，需在事件循环中调用）"""
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.error(f"网络健康监测异常: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def check_all(self):
+        """立即探测所有已登记的地址"""
+        await asyncio.gather(*(self._probe(origin) for origin in list(self._targets)))
+
+    async def _probe(self, origin: str):
+        """探测单个主机：收到任意 HTTP 响应即视为可达"""
+        status = self._status.setdefault(origin, {"ok": None, "failures": 0})
+        start = time.perf_counter()
+        try:
+            async with self.http.session.head(
+                origin, allow_redirects=False, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            ) as response:
+                if status["ok"] is False:
+                    logger.info(f"网络健康监测：{origin} 已恢复")
+                status.update(
+                    ok=True,
+                    failures=0,
+                    http_status=response.status,
+                    latency_ms=round((time.perf_counter() - start) * 1000),
+                    error="",
+                )
+        except Exception as e:
+            was_ok = status["ok"] is not False
+            status["failures"] += 1
+            status.update(
+                ok=status["failures"] < self.fail_threshold,
+                latency_ms=None,
+                error=str(e) or type(e).__name__,
+            )
+            if was_ok and not status["ok"]:
+                logger.warning(f"网络健康监测：{origin} 不可达 | 错误: {status['error']}")
+        status["checked_at"] = time.time()
+
+    def status(self, url: str) -> dict | None:
+        """返回地址所在主机的最近探测结果（未探测过返回 None）"""
+        return self._status.get(url_origin(url))
+
+    def is_down(self, url: str) -> bool:
+        """主机是否已被判定为不可用（未知状态视为可用）"""
+        status = self.status(url)
+        return bool(status) and status["ok"] is False
+
+    def snapshot(self) -> dict[str, dict]:
+        return {origin: dict(status) for origin, status in self._status.items()}
+
+    def stats(self) -> dict:
+        """指标采集：各主机的可用状态、连续失败次数与探测延迟"""
+        snapshot = self.snapshot()
+        return {
+            "hosts_watched": len(self._targets),
+            "hosts_down": sum(1 for status in snapshot.values() if status["ok"] is False),
+            "hosts": snapshot,
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._owns_http:
+            await self.http.close()
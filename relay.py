@@ -0,0 +1,238 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import aiofiles
+import aiohttp
+from aiohttp import web
+from astrbot.api import logger
+
+from .cache import AudioCache
+from .net import HttpClient
+
+
+class _RelayEntry:
+    """一个中转音频：上游只下载一次，所有请求方读取同一个文件"""
+    def __init__(self, url: str, song_id, bitrate: str):
+        self.url = url
+        self.song_id = song_id
+        self.bitrate = bitrate
+        self.created = time.monotonic()
+        self.path: Path | None = None
+        self.content_type = "audio/mpeg"
+        self.total: int | None = None
+        self.written = 0
+        self.done = False
+        self.error: Exception | None = None
+        self.task: asyncio.Task | None = None
+        self.cached = False  # 文件是否已移入音频缓存（由缓存管理，不再删除）
+        self.cond = asyncio.Condition()
+
+    async def notify(self):
+        async with self.cond:
+            self.cond.notify_all()
+
+
+class _LeasedFileResponse(web.FileResponse):
+    """发送期间占用音频缓存文件的 FileResponse（由 aiohttp 调用 prepare 时发送整个文件）"""
+    def __init__(self, path: Path, lease, **kwargs):
+        super().__init__(path, **kwargs)
+        self._lease = lease
+
+    async def prepare(self, request: web.BaseRequest):
+        with self._lease:
+            return await super().prepare(request)
+
+
+class AudioRelay:
+    """
+    本地音频中转服务：平台从本地地址拉取音频，插件边下载边转发，发送与下载同时进行
+    - 同一音频（歌曲ID + 码率）的多次发送共享一次上游下载
+    - 下载完成且大小校验通过后移入音频缓存，之后的请求直接返回缓存文件
+    - 未启用音频缓存时，下载好的文件保留 entry_ttl 秒供后续发送复用
+    - public_base: 协议端访问本服务使用的地址（协议端与 AstrBot 不在同一主机/容器时需配置）
+    """
+    def __init__(
+        self,
+        http: HttpClient,
+        temp_dir: Path,
+        audio_cache: AudioCache | None = None,
+        host: str = "127.0.0.1",
+        port: int = 8790,
+        public_base: str = "",
+        entry_ttl: float = 600,
+        stall_timeout: float = 15,
+        chunk_size: int = 64 * 1024,
+    ):
+        self.http = http
+        self.temp_dir = Path(temp_dir)
+        self.audio_cache = audio_cache
+        self.host = host
+        self.port = port
+        local_host = "127.0.0.1" if host in ("0.0.0.0", "") else host
+        self.public_base = (public_base or f"http://{local_host}:{port}").rstrip("/")
+        self.entry_ttl = entry_ttl
+        self.stall_timeout = stall_timeout
+        self.chunk_size = chunk_size
+        self._entries: dict[str, _RelayEntry] = {}  # token -> 中转音频
+        self._tokens: dict[str, str] = {}  # 音频标识 -> token
+        self._runner: web.AppRunner | None = None
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        """启动本地 HTTP 服务（可重复调用）"""
+        async with self._start_lock:
+            if self._runner is not None:
+                return
+            app = web.Application()
+            app.router.add_get("/audio/{token}", self._handle)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, self.host, self.port).start()
+            self._runner = runner
+            logger.info(f"音频中转服务已启动 | 监听: {self.host}:{self.port} | 对外地址: {self.public_base}")
+
+    async def url_for(self, url: str, song_id=None, bitrate: str = "") -> str:
+        """登记上游音频并返回供平台拉取的中转地址"""
+        await self.start()
+        self._prune()
+        key = AudioCache.make_name(song_id, bitrate) if song_id is not None else url
+        token = self._tokens.get(key)
+        if token is None or token not in self._entries:
+            token = os.urandom(8).hex()
+            self._entries[token] = _RelayEntry(url, song_id, bitrate)
+            self._tokens[key] = token
+        return f"{self.public_base}/audio/{token}"
+
+    def _prune(self):
+        """清理过期的中转记录（仍在下载的不清理）"""
+        now = time.monotonic()
+        for token, entry in list(self._entries.items()):
+            if now - entry.created < self.entry_ttl or (entry.task is not None and not entry.task.done()):
+                continue
+            del self._entries[token]
+            if entry.path is not None and not entry.cached:
+                entry.path.unlink(missing_ok=True)
+        live = set(self._entries)
+        self._tokens = {key: token for key, token in self._tokens.items() if token in live}
+
+    def _cached_file(self, entry: _RelayEntry) -> Path | None:
+        if self.audio_cache is not None and entry.song_id is not None:
+            return self.audio_cache.get(entry.song_id, entry.bitrate)
+        return None
+
+    def _ensure_fetch(self, entry: _RelayEntry):
+        # 首次请求、上次下载失败或已下载的文件被清理时（重新）发起上游下载
+        if entry.task is None or entry.task.done() and (
+            entry.error is not None or not (entry.path and entry.path.exists())
+        ):
+            entry.error = None
+            entry.done = False
+            entry.cached = False
+            entry.written = 0
+            entry.task = asyncio.create_task(self._fetch(entry))
+
+    async def _fetch(self, entry: _RelayEntry):
+        """上游单连接顺序下载，每写入一块就通知等待中的请求方"""
+        if self.audio_cache is not None and entry.song_id is not None:
+            temp_path = self.audio_cache.temp_path(entry.song_id, entry.bitrate)
+        else:
+            temp_path = self.temp_dir / f"relay_{os.urandom(4).hex()}.part"
+        entry.path = temp_path
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.stall_timeout, sock_read=self.stall_timeout)
+        try:
+            async with self.http.session.get(entry.url, timeout=timeout) as response:
+                response.raise_for_status()
+                entry.total = int(response.headers.get("Content-Length", 0)) or None
+                entry.content_type = response.headers.get("Content-Type", "audio/mpeg")
+                async with aiofiles.open(temp_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        await f.write(chunk)
+                        await f.flush()
+                        entry.written += len(chunk)
+                        await entry.notify()
+            if entry.written == 0 or (entry.total and entry.written != entry.total):
+                raise aiohttp.ClientPayloadError(f"中转下载不完整: {entry.written}/{entry.total} 字节")
+            if self.audio_cache is not None and entry.song_id is not None:
+                entry.path = self.audio_cache.commit(temp_path, entry.song_id, entry.bitrate)
+                entry.cached = True
+            entry.done = True
+            logger.info(f"中转下载完成: {entry.path.name} | {entry.written} 字节")
+        except Exception as e:
+            entry.error = e
+            logger.error(f"中转下载失败: {str(e) or type(e).__name__} | URL: {entry.url}")
+            temp_path.unlink(missing_ok=True)  # 已打开的读取方仍可读完已写入的部分
+        finally:
+            await entry.notify()
+
+    def _send_file(self, entry: _RelayEntry, path: Path, content_type: str) -> web.FileResponse:
+        """整文件发送；缓存文件在发送完成前占用，避免被并发的缓存淘汰删除"""
+        headers = {"Content-Type": content_type}
+        if self.audio_cache is None or entry.song_id is None:
+            return web.FileResponse(path, headers=headers)
+        return _LeasedFileResponse(path, self.audio_cache.lease(entry.song_id, entry.bitrate), headers=headers)
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        entry = self._entries.get(request.match_info["token"])
+        if entry is None:
+            raise web.HTTPNotFound()
+        cached = self._cached_file(entry)
+        if cached:
+            return self._send_file(entry, cached, "audio/mpeg")
+        if entry.done and entry.path is not None and entry.path.exists():
+            return self._send_file(entry, entry.path, entry.content_type)
+
+        self._ensure_fetch(entry)
+        async with entry.cond:
+            await entry.cond.wait_for(lambda: entry.written > 0 or entry.done or entry.error is not None)
+        if entry.written == 0:
+            raise web.HTTPBadGateway(text="上游音频获取失败")
+
+        try:
+            f = await aiofiles.open(entry.path, "rb")
+        except FileNotFoundError:
+            # 打开前下载恰好完成并移入了缓存
+            if entry.done:
+                return self._send_file(entry, entry.path, entry.content_type)
+            raise web.HTTPBadGateway(text="上游音频获取失败")
+
+        response = web.StreamResponse(headers={"Content-Type": entry.content_type})
+        if entry.total:
+            response.content_length = entry.total
+        await response.prepare(request)
+        sent = 0
+        try:
+            while True:
+                chunk = await f.read(self.chunk_size)
+                if chunk:
+                    await response.write(chunk)
+                    sent += len(chunk)
+                    continue
+                if entry.error is not None or entry.done and sent >= entry.written:
+                    break
+                if entry.done:
+                    continue  # 读到文件末尾后下载才完成：继续读完剩余数据
+                async with entry.cond:
+                    await entry.cond.wait_for(
+                        lambda: entry.written > sent or entry.done or entry.error is not None
+                    )
+        finally:
+            await f.close()
+        if entry.error is not None:
+            response.force_close()  # 上游中断：关闭连接，让平台感知到数据不完整
+            return response
+        await response.write_eof()
+        return response
+
+    async def close(self):
+        for entry in self._entries.values():
+            if entry.task is not None:
+                entry.task.cancel()
+            if entry.path is not None and not entry.cached:
+                entry.path.unlink(missing_ok=True)
+        self._entries.clear()
+        self._tokens.clear()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,158 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from astrbot.api import logger
+
+
+class Trace:
+    """一次消息处理的追踪记录：trace_id + 按开始时间排列的耗时片段（span）"""
+    def __init__(self, max_spans: int = 200, **attrs):
+        self.trace_id = os.urandom(8).hex()
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.attrs = attrs
+        self.spans: list[dict] = []
+        self.max_spans = max_spans
+        self.dropped_spans = 0
+
+    def add_span(self, name: str, start: float, end: float, **attrs):
+        if len(self.spans) >= self.max_spans:
+            self.dropped_spans += 1
+            return
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 1),
+            "duration_ms": round((end - start) * 1000, 1),
+            **attrs,
+        })
+
+    def to_dict(self, duration: float) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "started_at": self.started_at,
+            "duration_ms": round(duration * 1000, 1),
+            "attrs": self.attrs,
+            "spans": sorted(self.spans, key=lambda span: (span["start_ms"], -span["duration_ms"])),
+            "dropped_spans": self.dropped_spans,
+        }
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("music_search_trace", default=None)
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    记录一个耗时片段；当前没有进行中的追踪时不做任何事（yield None）。
+    yield 出的字典可在片段内补充属性（如 HTTP 状态码、字节数），异常时自动记录 error
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = str(e)[:200] or type(e).__name__
+        raise
+    finally:
+        trace.add_span(name, start, time.perf_counter(), **attrs)
+
+
+class Tracer:
+    """
+    慢请求追踪：为每条进入处理流程的消息分配 trace_id，记录各阶段与 HTTP 调用的耗时片段
+    - 总耗时超过 slow_threshold 秒的追踪写入 JSONL 文件（超过 max_bytes 时轮转，保留 backups 个旧文件）
+    - profile_rate: 按比例对请求启用 cProfile，仅在该请求最终为慢请求时把热点函数附加到追踪记录中；
+      cProfile 作用于整个事件循环线程，同一时间只对一个请求采样
+    """
+    def __init__(
+        self,
+        path: Path,
+        slow_threshold: float = 5.0,
+        max_bytes: int = 10 * 1024 * 1024,
+        backups: int = 3,
+        profile_rate: float = 0.0,
+        profile_top: int = 25,
+    ):
+        self.path = Path(path)
+        self.slow_threshold = slow_threshold
+        self.max_bytes = max_bytes
+        self.backups = max(0, int(backups))
+        self.profile_rate = profile_rate
+        self.profile_top = profile_top
+        self._profiling = False
+        self.traces = 0
+        self.slow_traces = 0
+
+    @contextmanager
+    def trace(self, **attrs):
+        """开始一次追踪（在当前上下文中生效，asyncio 子任务会继承）"""
+        trace = Trace(**attrs)
+        token = _current_trace.set(trace)
+        profiler = None
+        if self.profile_rate > 0 and not self._profiling and random.random() < self.profile_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self._profiling = True
+            except ValueError:  # 已有其他分析器在运行
+                profiler = None
+        try:
+            yield trace
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            _current_trace.reset(token)
+            self._finish(trace, time.perf_counter() - trace.started, profiler)
+
+    def _finish(self, trace: Trace, duration: float, profiler: cProfile.Profile | None):
+        self.traces += 1
+        if duration < self.slow_threshold:
+            return
+        self.slow_traces += 1
+        record = trace.to_dict(duration)
+        if profiler is not None:
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(self.profile_top)
+            record["profile"] = output.getvalue()
+        logger.warning(f"慢请求 | trace_id: {trace.trace_id} | 耗时: {duration:.2f}秒 | 片段数: {len(trace.spans)}")
+        try:
+            self._write(record)
+        except Exception as e:
+            logger.error(f"慢请求追踪写入失败: {str(e)}")
+
+    def _write(self, record: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists() and self.path.stat().st_size >= self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def _rotate(self):
+        """traces.jsonl → traces.jsonl.1 → … → traces.jsonl.{backups}（最旧的删除）"""
+        if self.backups == 0:
+            self.path.unlink(missing_ok=True)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{index}")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{index + 1}"))
+        os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+
+    def stats(self) -> dict:
+        return {"traces": self.traces, "slow_traces": self.slow_traces}
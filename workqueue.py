@@ -0,0 +1,113 @@
+import asyncio
+import contextvars
+import itertools
+import time
+
+from astrbot.api import logger
+
+
+class QueueFullError(RuntimeError):
+    """任务队列已满，新任务被拒绝"""
+
+
+class WorkQueue:
+    """
+    有界优先级任务队列 + 固定数量的工作协程，限制同时处理的点歌请求数
+    - submit(factory, priority)：factory 为无参协程函数，入队后等待其执行结果；队列满时抛出 QueueFullError
+    - priority 越小越先处理（如 @机器人 的消息优先），同优先级按提交顺序
+    - 等待方被取消时，尚未开始执行的任务直接丢弃
+    - 任务在提交方的 contextvars 上下文中执行（追踪信息等随任务传递到工作协程）
+    - 统计：队列深度（当前/峰值）、排队等待时间（平均/最大）、完成数、拒绝数
+    """
+    def __init__(self, workers: int = 4, max_size: int = 32):
+        self.workers = max(1, int(workers))
+        self.max_size = max(1, int(max_size))
+        self._queue: asyncio.PriorityQueue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._seq = itertools.count()
+        self.peak_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.started = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self):
+        """启动工作协程（可重复调用，需在事件循环中调用）"""
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(self.max_size)
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, factory, priority: int = 1):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(
+                (priority, next(self._seq), time.monotonic(), factory, future, contextvars.copy_context())
+            )
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(f"任务队列已满，拒绝新请求 | 队列深度: {self.depth}/{self.max_size}")
+            raise QueueFullError("任务队列已满")
+        self.peak_depth = max(self.peak_depth, self.depth)
+        return await future
+
+    async def _worker(self):
+        while True:
+            _, _, enqueued_at, factory, future, context = await self._queue.get()
+            try:
+                if future.done():  # 等待方已取消
+                    self.dropped += 1
+                    continue
+                waited = time.monotonic() - enqueued_at
+                self.started += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                task = context.run(asyncio.create_task, factory())
+                try:
+                    result = await task
+                except asyncio.CancelledError:
+                    task.cancel()
+                    if not future.done():
+                        future.cancel()
+                    raise
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                self.completed += 1
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        started = self.started
+        return {
+            "depth": self.depth,
+            "peak_depth": self.peak_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "wait_avg": round(self.wait_total / started, 3) if started else 0.0,
+            "wait_max": round(self.wait_max, 3),
+        }
+
+    async def close(self):
+        """停止工作协程，并取消仍在排队的任务（等待中的 submit 随之抛出 CancelledError）"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        while self._queue is not None and not self._queue.empty():
+            future = self._queue.get_nowait()[4]
+            self._queue.task_done()
+            if not future.done():
+                future.cancel()
+                self.dropped += 1